@@ -1,15 +1,31 @@
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 from audio_recorder_streamlit import audio_recorder
-import speech_recognition as sr
-import io
 import base64
+import hashlib
+import time
+import uuid
+import streamlit.components.v1 as components
+from streamlit import runtime
+from voice_engine import llm, stt, stt_backends, telemetry
+from voice_engine.chat_context import (
+    CHAT_CONTEXT_TOKENS, CHAT_SUMMARIZE, SUMMARY_INSTRUCTION,
+    estimate_tokens, summarize_turns, to_gemini_history, window_history
+)
+from voice_engine.commands import detect_voice_command, help_groups
+from voice_engine.lazy import preload
+from voice_engine.recording_id import recent_recordings, recording_fingerprint
+from voice_engine.response_cache import get_response_cache, make_scope
+from voice_engine.speculation import SpeculativeReply
+from voice_engine.spoken_reply import SpokenReply
+from voice_engine.workers import get_workers
 
 # Load environment variables
 load_dotenv()
 
+log = telemetry.get_logger("app")
+
 # Configure Gemini API
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
@@ -23,192 +39,424 @@ if not api_key:
     st.error("❌ GEMINI_API_KEY not found!")
     st.stop()
 
-genai.configure(api_key=api_key)
+llm.configure(api_key)
 
-# Function to convert audio to text
-def transcribe_audio(audio_bytes, language='en-US'):
-    """Convert audio bytes to text using speech recognition"""
-    import wave
-    import tempfile
+# Stream Gemini responses into the chat bubble as they arrive (set STREAM_RESPONSES=false to disable)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() != "false"
 
-    if not audio_bytes or len(audio_bytes) == 0:
-        return None, "empty", None  # Return error type and text
+# Number of most recent messages rendered on each rerun, older ones load on request
+HISTORY_WINDOW = max(int(os.getenv("HISTORY_WINDOW", "20")), 1)
 
-    try:
-        # The audio_recorder returns WAV audio data
-        recognizer = sr.Recognizer()
+# Served from /app/static/ when server.enableStaticServing is on (.streamlit/config.toml)
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
 
-        # Adjust for better accuracy
-        recognizer.energy_threshold = 300
-        recognizer.dynamic_energy_threshold = True
+# Streamlit release known to serve static .css files as text/css. Older static file servers send
+# them as text/plain with nosniff, which browsers refuse to apply, so the CSS is inlined there
+STATIC_CSS_STREAMLIT = (1, 65)
 
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_filename = tmp_file.name
+# How reply audio reaches the browser: "media" serves it from Streamlit's media endpoint,
+# "inline" embeds it in the page as a base64 data URI
+AUDIO_DELIVERY = os.getenv("AUDIO_DELIVERY", "media").lower()
 
-        try:
-            # Read with speech_recognition's AudioFile
-            with sr.AudioFile(tmp_filename) as source:
-                # Adjust for ambient noise
-                recognizer.adjust_for_ambient_noise(source, duration=0.2)
-                audio_data = recognizer.record(source)
+# Open the Gemini request as soon as a recording is transcribed, before the page reruns with it
+# (set SPECULATIVE_REPLIES=false to disable)
+SPECULATIVE_REPLIES = os.getenv("SPECULATIVE_REPLIES", "true").lower() != "false"
 
-            # Clean up temp file
-            os.unlink(tmp_filename)
+# How often the page checks on a background job while it runs
+JOB_POLL_SECONDS = 0.25
 
-            # Check if audio is too short
-            if len(audio_data.frame_data) < 1000:
-                return None, "silent", None
+# How long a new audio segment stays in the polled reply, long enough for the player to pick it up
+SEGMENT_HANDOFF_SECONDS = 2.0
 
-            # Transcribe with selected language
-            text = recognizer.recognize_google(audio_data, language=language)
+# Speak streamed responses sentence by sentence instead of after the full reply (set TTS_PIPELINE=false to disable)
+TTS_PIPELINE = os.getenv("TTS_PIPELINE", "true").lower() != "false"
 
-            if not text or text.strip() == "":
-                return None, "silent", None
+# Function to build the bounded conversation history sent with the next prompt
+def build_chat_history(messages):
+    """Earlier turns within CHAT_CONTEXT_TOKENS, older ones summarized (CHAT_SUMMARIZE) or dropped"""
+    if CHAT_CONTEXT_TOKENS <= 0:
+        return []
 
-            return text, "success", None
+    summary = st.session_state.history_summary if CHAT_SUMMARIZE else ""
+    older, recent = window_history(messages, CHAT_CONTEXT_TOKENS - estimate_tokens(summary))
 
-        except Exception as e:
-            # Clean up temp file if it still exists
-            if os.path.exists(tmp_filename):
-                os.unlink(tmp_filename)
-            raise e
-
-    except sr.UnknownValueError:
-        return None, "no_speech", None
-    except sr.RequestError as e:
-        return None, "network_error", None
-    except Exception as e:
-        return None, "unknown_error", None
+    if CHAT_SUMMARIZE:
+        # Summarize in batches of half the budget so the extra call isn't paid on every turn
+        unsummarized = older[st.session_state.summarized_count:]
+        if sum(estimate_tokens(message["content"]) for message in unsummarized) >= CHAT_CONTEXT_TOKENS // 2:
+            try:
+                summary = summarize_turns(llm.get_model(SUMMARY_INSTRUCTION), unsummarized, summary)
+                st.session_state.history_summary = summary
+                st.session_state.summarized_count = len(older)
+            except Exception as e:
+                log.warning("History summary error: %s: %s", type(e).__name__, e)
 
-# Function to convert text to speech with natural human-like voice
-def text_to_speech(text, voice=None):
-    """Convert text to speech with natural human-like voice using Edge TTS"""
-    try:
-        import tempfile
-        import asyncio
-        import edge_tts
-
-        # Use provided voice or default to English male
-        if not voice:
-            voice = 'en-US-GuyNeural'
-
-        # Create temp file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        temp_path = temp_file.name
-        temp_file.close()
-
-        # Generate speech with Edge TTS (natural pauses at periods, commas, etc.)
-        # Using expressive style for more emotions and dramatic pauses
-
-        # DEBUG: Log TTS input
-        print(f"\n[TTS DEBUG] Text length: {len(text)} chars")
-        print(f"[TTS DEBUG] Voice: {voice}")
-        print(f"[TTS DEBUG] First 150 chars: {text[:150]}")
-        print(f"[TTS DEBUG] Last 150 chars: {text[-150:]}\n")
-
-        async def generate_speech():
-            # Detect language from text characters
-            has_korean = any('\uac00' <= char <= '\ud7a3' for char in text)
-            has_chinese = any('\u4e00' <= char <= '\u9fff' for char in text)
-            has_japanese = any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text)
-            has_arabic = any('\u0600' <= char <= '\u06ff' for char in text)
-            has_hindi = any('\u0900' <= char <= '\u097f' for char in text)
-
-            # Auto-detect and switch voice based on text language
-            use_voice = voice
-            if has_korean and not voice.startswith('ko-'):
-                use_voice = 'ko-KR-InJoonNeural'
-                print(f"[TTS DEBUG] Korean text detected, switching to: {use_voice}")
-            elif has_chinese and not voice.startswith('zh-'):
-                use_voice = 'zh-CN-YunxiNeural'
-                print(f"[TTS DEBUG] Chinese text detected, switching to: {use_voice}")
-            elif has_japanese and not voice.startswith('ja-'):
-                use_voice = 'ja-JP-KeitaNeural'
-                print(f"[TTS DEBUG] Japanese text detected, switching to: {use_voice}")
-            elif has_arabic and not voice.startswith('ar-'):
-                use_voice = 'ar-SA-HamedNeural'
-                print(f"[TTS DEBUG] Arabic text detected, switching to: {use_voice}")
-            elif has_hindi and not voice.startswith('hi-'):
-                use_voice = 'hi-IN-MadhurNeural'
-                print(f"[TTS DEBUG] Hindi text detected, switching to: {use_voice}")
-
-            # Use style for more emotional and expressive delivery
-            communicate = edge_tts.Communicate(
-                text,
-                use_voice,
-                rate='+0%',
-                pitch='+0Hz',
-                # Add prosody for more dramatic expression
-                volume='+0%'
-            )
-            await communicate.save(temp_path)
-
-        # Run async function
-        asyncio.run(generate_speech())
-
-        # DEBUG: Check generated file
-        if os.path.exists(temp_path):
-            file_size = os.path.getsize(temp_path)
-            print(f"[TTS DEBUG] Audio file created: {temp_path}")
-            print(f"[TTS DEBUG] Audio file size: {file_size} bytes\n")
-        else:
-            print(f"[TTS DEBUG] ERROR: Audio file not created!\n")
+    return to_gemini_history(recent, summary)
 
-        return temp_path
-    except Exception as e:
-        # Log the specific error
-        print(f"TTS Error: {type(e).__name__}: {str(e)}")
-        st.warning(f"Could not generate voice: {str(e)}")
+# Function to start the conversation over
+def clear_chat():
+    """Empty the chat along with the running summary of its older turns"""
+    st.session_state.messages = []
+    st.session_state.history_summary = ""
+    st.session_state.summarized_count = 0
+
+# Function to start timing a turn for telemetry
+def begin_turn(kind, **fields):
+    """Start this session's telemetry turn, closing one that never finished"""
+    if st.session_state.turn is not None:
+        telemetry.finish_turn("abandoned", st.session_state.turn)
+    st.session_state.turn = telemetry.start_turn(kind, language=st.session_state.language, **fields)
+
+# Function to export this session's telemetry turn
+def end_turn(status="ok"):
+    """Finish the turn with a status, its spans go to the JSON log and Prometheus"""
+    telemetry.finish_turn(status, st.session_state.turn)
+    st.session_state.turn = None
+
+# Function to start background work with a handle kept in the session
+def start_job(kind, function, *args):
+    """Submit function(job, *args) to the shared workers, cancelling this session's previous job of the same kind"""
+    previous = st.session_state.jobs.get(kind)
+    if previous and not previous.done():
+        previous.cancel()  # E.g. a reply abandoned when the user sent another message mid-stream
+    job = get_workers().submit(kind, function, *args)
+    st.session_state.jobs[kind] = job
+    return job
+
+# Function to wait for a background job without holding the script run
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def wait_for_job(job, message):
+    """Show progress while the job runs, then rerun the app to handle its result"""
+    if job.done():
+        st.rerun()
+    st.markdown(f"<p style='text-align: center; color: #e0e0e0;'>{message}</p>", unsafe_allow_html=True)
+
+# Function to open a reply that can start before the transcript is sent
+def new_speculation():
+    """SpeculativeReply handed to the transcription job, ready once prepare_speculation has run"""
+    previous = st.session_state.pop("speculation", None)
+    if previous:
+        previous.cancel()
+    speculation = SpeculativeReply()
+    st.session_state.speculation = speculation
+    return speculation
+
+# Function to set up the speculative reply while the recording is transcribed
+def prepare_speculation(speculation):
+    """Give the reply the current personality and history, after transcription has started"""
+    system_instruction = llm.build_system_instruction(st.session_state.custom_personality)
+    # The SDK import and model build happen on the workers, not ahead of this run
+    get_workers().submit("warmup", lambda job: llm.get_model(system_instruction))
+    history = build_chat_history(st.session_state.messages)  # May wait on a summary call
+    scope = make_scope(system_instruction, history)
+    response_cache = get_response_cache()
+
+    def start_reply(prompt):
+        if response_cache and response_cache.has(prompt, scope):
+            return None  # Will be answered from the cache
+        return get_workers().submit("reply", llm.generate_reply, llm.start_chat(system_instruction, history), prompt)
+
+    speculation.ready(scope, start_reply)
+
+# Function to take over the reply opened while the recording was transcribed
+def adopt_speculation(prompt, scope):
+    """The speculative reply job when it was started for this prompt and context, otherwise None"""
+    speculation = st.session_state.pop("speculation", None)
+    if not speculation:
         return None
+    job = speculation.adopt(prompt, scope)
+    if job:
+        log.debug("Reply already in flight, adopting it")
+        telemetry.annotate(speculative=True)
+        st.session_state.jobs["reply"] = job
+    return job
+
+# Function to get a URL the browser can fetch reply audio from
+def audio_source_url(audio_bytes, coordinates):
+    """Serve audio from Streamlit's media endpoint, or embed it as a base64 data URI"""
+    if AUDIO_DELIVERY == "media":
+        try:
+            if runtime.exists():
+                # Served over HTTP with range support instead of riding the websocket as page HTML
+                url = runtime.get_instance().media_file_mgr.add(audio_bytes, "audio/mpeg", coordinates)
+                base_path = st.get_option("server.baseUrlPath").strip("/")
+                return f"/{base_path}{url}" if base_path else url
+        except Exception as e:
+            log.warning("Media file error, embedding audio instead: %s: %s", type(e).__name__, e)
+
+    audio_base64 = base64.b64encode(audio_bytes).decode()
+    return f"data:audio/mp3;base64,{audio_base64}"
+
+# Function to render one synthesized sentence for the reply's player
+def render_audio_segment(audio_url, turn_id, index):
+    """Add an audio element for a sentence, picked up and played in order by render_audio_chain"""
+    st.markdown(f"""
+        <audio id="response_audio_{turn_id}_{index}" preload="none">
+            <source src="{audio_url}" type="audio/mpeg">
+        </audio>
+    """, unsafe_allow_html=True)
+    telemetry.mark("first_audio")
 
-# Function to detect and execute voice commands
-def detect_voice_command(text):
-    """Detect if the transcribed text is a voice command and execute it"""
-    if not text:
-        return None, None
-
-    text_lower = text.lower().strip()
-
-    # Clear chat command
-    if "clear chat" in text_lower or "clear conversation" in text_lower or "delete history" in text_lower:
-        return "clear_chat", "Cleared conversation history!"
-
-    # Change personality commands
-    if "change personality" in text_lower or "switch personality" in text_lower:
-        if "clash royale" in text_lower or "clash royal" in text_lower:
-            return "change_personality", "Clash Royale"
-        elif "professional" in text_lower:
-            return "change_personality", "Professional"
-
-    # Voice speed commands
-    if "speak faster" in text_lower or "talk faster" in text_lower or "speed up" in text_lower:
-        return "voice_speed", 1.5
-    elif "speak slower" in text_lower or "talk slower" in text_lower or "slow down" in text_lower:
-        return "voice_speed", 1.0
-    elif "normal speed" in text_lower or "regular speed" in text_lower:
-        return "voice_speed", 1.3
-
-    # Music commands
-    if "play music" in text_lower or "start music" in text_lower or "turn on music" in text_lower:
-        return "music", True
-    elif "stop music" in text_lower or "pause music" in text_lower or "turn off music" in text_lower:
-        return "music", False
-
-    # Voice change commands
-    if "change voice" in text_lower or "switch voice" in text_lower:
-        if "female" in text_lower or "woman" in text_lower or "girl" in text_lower:
-            return "voice_change", "en-US-AriaNeural"
-        elif "male" in text_lower or "man" in text_lower or "guy" in text_lower:
-            return "voice_change", "en-US-GuyNeural"
-        elif "british" in text_lower:
-            if "female" in text_lower:
-                return "voice_change", "en-GB-SoniaNeural"
-            else:
-                return "voice_change", "en-GB-RyanNeural"
+# Function to play a reply's sentence audio elements back to back
+def render_audio_chain(turn_id, speed):
+    """Play response_audio_<turn>_<n> in order at the configured speed, waiting for late segments
+
+    The player lives in the page body, outside Streamlit's elements, so the fragment redrawing
+    the reply and the rerun that ends it don't cut the speech. It keeps the source of every
+    segment it has seen on the page, so a segment only has to be rendered until it is picked up.
+    A chain rendered on a later run takes it over where it is, a chain for another reply
+    restarts it; once no chain for the reply is on the page it stops.
+    """
+    components.html(f"""
+        <script>
+            var doc = window.parent.document;
+            var token = String(Math.random());
+            var player = doc.getElementById('reply_player');
+            if (!player) {{
+                player = doc.createElement('audio');
+                player.id = 'reply_player';
+                doc.body.appendChild(player);
+            }}
+            if (player.dataset.reply !== '{turn_id}') {{
+                // A new reply takes the player over from the start, dropping the previous one's speech
+                player.pause();
+                player.removeAttribute('src');
+                player.load();
+                player.dataset.reply = '{turn_id}';
+                player.dataset.next = '0';
+                player.sources = [];
+            }}
+            player.dataset.owner = token;
+            player.defaultPlaybackRate = {speed};
+            player.playbackRate = {speed};
+            var waited = 0;
+            function play() {{
+                player.play().catch(function(error) {{
+                    console.log("Autoplay prevented:", error);
+                }});
+            }}
+            function collect() {{
+                doc.querySelectorAll('audio[id^="response_audio_{turn_id}_"]').forEach(function(segment) {{
+                    player.sources[Number(segment.id.split('_').pop())] = segment.querySelector('source').src;
+                }});
+            }}
+            function playNext() {{
+                if (player.dataset.owner !== token) {{ return; }}
+                collect();
+                var index = Number(player.dataset.next);
+                var source = player.sources[index];
+                if (!source) {{
+                    // Segment not rendered yet - keep polling for up to a minute
+                    waited += 150;
+                    if (waited < 60000) {{ setTimeout(playNext, 150); }}
+                    return;
+                }}
+                waited = 0;
+                player.dataset.next = String(index + 1);
+                player.src = source;
+                play();
+            }}
+            // Segments rendered while a sentence plays are only on the page for a moment
+            var collecting = setInterval(function() {{
+                if (player.dataset.owner === token) {{ collect(); }} else {{ clearInterval(collecting); }}
+            }}, 100);
+            player.onended = playNext;
+            if (player.currentSrc && !player.ended) {{
+                play();  // Carry on with the sentence an earlier chain was playing
+            }} else {{
+                playNext();
+            }}
+            window.addEventListener('pagehide', function() {{
+                // The page was rerun without this chain, e.g. a new turn started
+                if (player.dataset.owner === token) {{ player.pause(); }}
+            }});
+        </script>
+    """, height=0)
+
+# Function to render the sentence audio the player may not have picked up yet
+def render_audio_segments(reply):
+    """Encode each new segment once, then render it for SEGMENT_HANDOFF_SECONDS while the page polls
+
+    Only a segment's first encode and render are timed, so the spans measure one of each
+    however often the segment is sent again.
+    """
+    now = time.monotonic()
+    urls, added = reply["audio_urls"], reply["audio_added"]
+    for index in range(len(urls), len(reply["spoken"].audio)):
+        started = time.perf_counter()
+        urls.append(audio_source_url(reply["spoken"].audio[index], f"response_audio.{reply['turn_id']}.{index}"))
+        added.append(now)
+        if index >= reply["timed_segments"]:
+            telemetry.record_span("audio_encode", started)
+    for index, url in enumerate(urls):
+        if now - added[index] < SEGMENT_HANDOFF_SECONDS:
+            started = time.perf_counter()
+            render_audio_segment(url, reply["turn_id"], index)
+            if index >= reply["timed_segments"]:
+                telemetry.record_span("render", started)
+    reply["timed_segments"] = max(reply["timed_segments"], len(urls))
+
+# Function to name a reply's audio on the page
+def reply_id():
+    """Id of the telemetry turn the reply belongs to, unique even after the chat is cleared"""
+    turn = st.session_state.turn
+    return turn.id if turn is not None else uuid.uuid4().hex[:12]
+
+# Function to start a reply the page polls instead of waiting on
+def start_reply(spoken, prompt, scope, cached=None):
+    """Keep the reply in the session with what finish_reply needs once it is complete"""
+    st.session_state.reply = {
+        "spoken": spoken,
+        "prompt": prompt,
+        "scope": scope,
+        "cached": cached,  # Response cache entry when the text came from it
+        "voice": st.session_state.selected_voice,
+        "turn_id": reply_id(),
+        "audio_urls": [],  # Where each segment is served from during this app run
+        "audio_added": [],  # When each segment was first rendered
+        "timed_segments": 0,  # Segments whose encode and render are in the turn's spans
+        "text_timed": False,  # Whether the final text's render is
+        "finished": False,
+    }
+
+# Function to stop the previous reply when a new turn starts
+def interrupt_reply():
+    """Cancel a reply still in progress; its speech stops once its chain leaves the page"""
+    reply = st.session_state.reply
+    if reply and not reply["finished"]:
+        reply["spoken"].cancel()
+    st.session_state.reply = None
+
+# Function to add the finished reply to the chat
+def finish_reply(reply):
+    """Store the reply in the history and the response cache, then rerun the app to show it there"""
+    spoken = reply["spoken"]
+    st.session_state.messages.append({"role": "assistant", "content": spoken.text})
+
+    cached = reply["cached"]
+    response_cache = get_response_cache()
+    if cached is None and response_cache:
+        cached = response_cache.put(reply["prompt"], reply["scope"], spoken.text)
+
+    # Keep the speech with the cached reply so a repeat skips TTS too (MP3 frames concatenate)
+    if cached and spoken.audio:
+        cached.audio[reply["voice"]] = b"".join(spoken.audio)
+
+    reply["finished"] = True
+    end_turn("ok")
+    st.rerun()
+
+# Function to report a reply that failed
+def fail_reply(error):
+    """Add the error to the chat in place of the reply and rerun the app to show it"""
+    error_message = f"⚠️ Error: {str(error)}"
+    st.session_state.messages.append({"role": "assistant", "content": error_message})
+    st.session_state.reply = None
+    end_turn("error")
+    st.rerun()
+
+# Function to show the reply as it streams in, without holding the script run
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_reply():
+    """Render the reply text and sentence audio so far, finishing the turn once both are complete"""
+    reply = st.session_state.reply
+    if reply is None or reply["finished"]:
+        return
+    telemetry.activate(st.session_state.turn)  # Fragment reruns skip the top of the script
+
+    spoken = reply["spoken"]
+    spoken.poll()
+    if spoken.error is not None:
+        fail_reply(spoken.error)
+    if spoken.done:
+        finish_reply(reply)
+
+    if STREAM_RESPONSES or spoken.text_done:
+        started = time.perf_counter()
+        st.markdown(spoken.text if spoken.text_done else spoken.text + "▌")
+        if spoken.text_done and not reply["text_timed"]:
+            # Streamed partial text is drawn again on every poll, only the final text is timed
+            telemetry.record_span("render", started)
+            reply["text_timed"] = True
+    render_audio_segments(reply)
+    if spoken.text_done:
+        st.markdown("<p style='color: #e0e0e0;'>🔊 Generating voice...</p>", unsafe_allow_html=True)
+
+# Function to render the reply in progress, or keep the last one speaking
+def render_reply(reply):
+    """Streaming replies get their chat bubble, finished ones are in the history and only keep their audio"""
+    render_audio_chain(reply["turn_id"], st.session_state.voice_speed)
+    # A full rerun drops the media files of the last one, so every segment is served and rendered again
+    reply["audio_urls"], reply["audio_added"] = [], []
+    if reply["finished"]:
+        render_audio_segments(reply)
+    else:
+        with st.chat_message("assistant"):
+            show_reply()
+
+# Function to build the voice command help from the command registry
+def command_help_html():
+    """Sidebar help listing every registered voice command with its example phrases"""
+    lines = []
+    for emoji, title, examples in help_groups():
+        lines.append(f"<p class='heading'>{emoji} {title}:</p>")
+        for number, example in enumerate(examples):
+            last = " class='last'" if number == len(examples) - 1 else ""
+            lines.append(f"<p{last}>• {example}</p>")
+    return "<div class='tips commands'>\n" + "\n".join(lines) + "\n</div>"
+
+# Function to reveal another window of older messages
+def show_earlier_messages():
+    """Button callback, runs before the rerun so the older messages appear immediately"""
+    st.session_state.history_shown += HISTORY_WINDOW
+
+# Function to display the conversation
+def render_history(messages):
+    """Render the most recent messages, older ones stay behind a "load earlier" button"""
+    if len(messages) <= HISTORY_WINDOW:
+        st.session_state.history_shown = HISTORY_WINDOW  # Back to one window after a clear
+
+    hidden = max(len(messages) - st.session_state.history_shown, 0)
+    if hidden and messages[hidden]["role"] == "assistant":
+        hidden -= 1  # Don't open the window with a reply whose question is hidden
+
+    if hidden:
+        st.button(
+            f"⬆️ Load earlier messages ({hidden} hidden)",
+            on_click=show_earlier_messages,
+            use_container_width=True,
+        )
 
-    return None, None
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+# Function to read the stylesheet once per process
+@st.cache_resource(show_spinner=False)
+def load_stylesheet():
+    """Stylesheet text and a short content hash for cache busting"""
+    with open(STYLESHEET_PATH, encoding="utf-8") as f:
+        css = f.read()
+    return css, hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+
+# Function to check whether this Streamlit can serve the stylesheet itself
+def static_css_served():
+    """True when static serving is on and the server sends .css with a stylesheet MIME type"""
+    if not st.get_option("server.enableStaticServing"):
+        return False
+    release = tuple(int(part) for part in st.__version__.split(".")[:2] if part.isdigit())
+    return release >= STATIC_CSS_STREAMLIT
+
+# Function to apply the app stylesheet on every rerun
+def inject_styles():
+    """Link the statically served stylesheet, or inline it when it can't be served as text/css"""
+    css, version = load_stylesheet()
+    if static_css_served():
+        # Elements not re-sent on a rerun are removed, so the link is sent every time - the
+        # browser keeps the stylesheet itself cached
+        st.markdown(f'<style>@import url("app/static/style.css?v={version}");</style>', unsafe_allow_html=True)
+    else:
+        st.markdown(f"<style>\n{css}</style>", unsafe_allow_html=True)
 
 # Personality configurations
 PERSONALITIES = {
@@ -254,166 +502,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for graffiti design
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Permanent+Marker&family=Bungee+Shade&display=swap');
-
-    /* Main background - graffiti wall colors */
-    .stApp {
-        background: linear-gradient(135deg, #1a1a2e 0%, #16213e 25%, #0f3460 50%, #533483 75%, #e94560 100%);
-    }
-
-    /* Sidebar styling - dark graffiti wall */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #2C2C2C 0%, #1A1A1A 100%);
-    }
-
-    /* Custom headers - graffiti style */
-    h1 {
-        font-family: 'Bungee Shade', cursive !important;
-        background: linear-gradient(90deg, #e94560 0%, #533483 25%, #0f3460 50%, #e94560 75%, #ff6b6b 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-weight: 900;
-        font-size: 3rem !important;
-        text-align: center;
-        padding: 20px 0;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-    }
-
-    h2, h3 {
-        font-family: 'Permanent Marker', cursive !important;
-        color: #e94560;
-        font-weight: 600;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
-    }
-
-    /* Chat messages - graffiti style */
-    .stChatMessage {
-        background: rgba(0, 0, 0, 0.3);
-        backdrop-filter: blur(10px);
-        border-radius: 15px;
-        border: 2px solid #e94560;
-        padding: 15px;
-        margin: 10px 0;
-    }
-
-    /* Remove black backgrounds from containers */
-    .stColumn {
-        background: transparent !important;
-    }
-
-    /* Audio recorder container styling */
-    .stColumn > div {
-        background: transparent !important;
-    }
-
-    /* Remove all black backgrounds and borders */
-    div[data-testid="column"] {
-        background: transparent !important;
-    }
-
-    div[data-testid="column"] > div {
-        background: transparent !important;
-    }
-
-    /* Remove black box around audio recorder */
-    .stAudio {
-        background: transparent !important;
-    }
-
-    /* Target all divs that might have black backgrounds */
-    div[class*="st-"] {
-        background-color: transparent !important;
-    }
-
-    /* Force iframe and all children to be transparent */
-    iframe, iframe * {
-        background: transparent !important;
-        background-color: transparent !important;
-    }
-
-    /* Target the specific audio recorder component and wrapper */
-    [class*="audio"], [class*="Audio"] {
-        background: transparent !important;
-        background-color: transparent !important;
-    }
-
-    /* Target element-container which wraps components */
-    [data-testid="element-container"] {
-        background: transparent !important;
-    }
-
-    /* Target stElementContainer */
-    .stElementContainer {
-        background: transparent !important;
-    }
-
-    /* Override specific dark/black backgrounds */
-    div[style*="background-color: rgb(0, 0, 0)"],
-    div[style*="background-color: rgba(0, 0, 0"],
-    div[style*="background-color: #000"],
-    div[style*="background: rgb(0, 0, 0)"],
-    div[style*="background: rgba(0, 0, 0"],
-    div[style*="background: #000"] {
-        background: transparent !important;
-        background-color: transparent !important;
-    }
-
-    /* Buttons - graffiti colors */
-    .stButton > button {
-        font-family: 'Permanent Marker', cursive !important;
-        background: linear-gradient(90deg, #e94560 0%, #533483 50%, #e94560 100%);
-        color: white;
-        border: 2px solid #000;
-        border-radius: 25px;
-        padding: 12px 30px;
-        font-weight: 600;
-        font-size: 16px;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(233, 69, 96, 0.6);
-        text-shadow: 1px 1px 2px rgba(0,0,0,0.5);
-    }
-
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(233, 69, 96, 0.8);
-    }
-
-    /* Text inputs */
-    .stTextArea textarea {
-        background: rgba(255, 255, 255, 0.1);
-        border: 2px solid rgba(255, 255, 255, 0.2);
-        border-radius: 15px;
-        color: white;
-        backdrop-filter: blur(10px);
-    }
-
-    /* Success/Info/Warning messages */
-    .stSuccess, .stInfo, .stWarning {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border-radius: 10px;
-        border-left: 4px solid #667eea;
-    }
-
-    /* Dividers */
-    hr {
-        border: none;
-        height: 2px;
-        background: linear-gradient(90deg, transparent 0%, #667eea 50%, transparent 100%);
-        margin: 30px 0;
-    }
-
-    /* Selectbox */
-    .stSelectbox > div > div {
-        background: rgba(255, 255, 255, 0.1);
-        border-radius: 10px;
-        color: white;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Custom CSS for graffiti design (static/style.css)
+inject_styles()
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -452,25 +542,37 @@ if "background_music" not in st.session_state:
 if "voice_speed" not in st.session_state:
     st.session_state.voice_speed = 1.3  # Default playback speed
 
+if "history_summary" not in st.session_state:
+    st.session_state.history_summary = ""  # Running summary of turns outside the context window
+
+if "summarized_count" not in st.session_state:
+    st.session_state.summarized_count = 0  # Completed turns (failed ones left out) folded into the summary
+
+if "jobs" not in st.session_state:
+    st.session_state.jobs = {}  # Background work in flight for this session, by kind
+
+if "history_shown" not in st.session_state:
+    st.session_state.history_shown = HISTORY_WINDOW  # Messages rendered from the end of the chat
+
+if "turn" not in st.session_state:
+    st.session_state.turn = None  # Telemetry turn in progress, it can span several reruns
+
+if "reply" not in st.session_state:
+    st.session_state.reply = None  # Latest reply: streaming and polled by show_reply, or finished and speaking
+
+# Spans recorded during this run (and the jobs it starts) belong to the turn in progress
+telemetry.activate(st.session_state.turn)
+
 # Sidebar
 with st.sidebar:
-    st.markdown("""
-        <div style='text-align: center; padding: 20px 0;'>
-            <h1 style='font-size: 2.5rem; margin: 0;'>🎙️</h1>
-            <h2 style='margin: 10px 0; color: #667eea;'>VoiceAI Pro</h2>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='brand'><h1>🎙️</h1><h2>VoiceAI Pro</h2></div>", unsafe_allow_html=True)
 
     st.divider()
 
     # Personality selector
     st.markdown("### 🎭 AI Personality")
 
-    st.markdown("""
-        <p style='color: #c0c0c0; font-size: 0.9rem; margin: 10px 0;'>
-            ✨ Type any personality you want!
-        </p>
-    """, unsafe_allow_html=True)
+    st.markdown("<p class='hint'>✨ Type any personality you want!</p>", unsafe_allow_html=True)
 
     custom_input = st.text_area(
         "Custom Personality:",
@@ -483,22 +585,22 @@ with st.sidebar:
     if custom_input and custom_input != st.session_state.custom_personality:
         st.session_state.custom_personality = custom_input
         st.session_state.personality = "Custom"
-        st.session_state.messages = []
+        clear_chat()
         st.rerun()
 
     # Display current personality
     if st.session_state.custom_personality:
         st.markdown(f"""
-            <div style='background: rgba(102, 126, 234, 0.2); padding: 15px; border-radius: 10px; margin: 10px 0;'>
-                <p style='font-size: 1.2rem; margin: 0;'>🎨 <strong>Current Personality</strong></p>
-                <p style='font-size: 0.9rem; color: #b0b0b0; margin: 5px 0 0 0;'>{st.session_state.custom_personality}</p>
+            <div class='personality-card'>
+                <p class='name'>🎨 <strong>Current Personality</strong></p>
+                <p class='detail'>{st.session_state.custom_personality}</p>
             </div>
         """, unsafe_allow_html=True)
     else:
         st.markdown("""
-            <div style='background: rgba(102, 126, 234, 0.2); padding: 15px; border-radius: 10px; margin: 10px 0;'>
-                <p style='font-size: 1.2rem; margin: 0;'>💼 <strong>Professional Assistant</strong></p>
-                <p style='font-size: 0.9rem; color: #b0b0b0; margin: 5px 0 0 0;'>Default personality - Type above to customize!</p>
+            <div class='personality-card'>
+                <p class='name'>💼 <strong>Professional Assistant</strong></p>
+                <p class='detail'>Default personality - Type above to customize!</p>
             </div>
         """, unsafe_allow_html=True)
 
@@ -506,17 +608,13 @@ with st.sidebar:
 
     # Clear chat button
     if st.button("🗑️ Clear Chat", use_container_width=True):
-        st.session_state.messages = []
+        clear_chat()
         st.rerun()
 
     st.divider()
 
     # Language selector with modern styling
-    st.markdown("""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h3 style='color: #e0e0e0; margin: 0;'>🌐 Voice Language</h3>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='section-title'><h3>🌐 Voice Language</h3></div>", unsafe_allow_html=True)
 
     languages = {
         "🇺🇸 English (US)": "en-US",
@@ -533,22 +631,30 @@ with st.sidebar:
         "🇸🇦 Arabic": "ar-SA"
     }
 
+    # Get current language name for default selection (voice commands can change it)
+    current_language_name = [k for k, v in languages.items() if v == st.session_state.language]
+    current_language_index = list(languages.keys()).index(current_language_name[0]) if current_language_name else 0
+
     selected_language = st.selectbox(
         "Language:",
         list(languages.keys()),
-        index=0,
+        index=current_language_index,
         label_visibility="collapsed"
     )
     st.session_state.language = languages[selected_language]
 
+    # Measured speech recognition latency, to compare backends
+    stt_latency = stt_backends.latency_stats.report()
+    for backend_name, latency in stt_latency.items():
+        st.caption(
+            f"🎧 {backend_name}: {latency['mean']:.2f}s avg · {latency['p95']:.2f}s p95 "
+            f"({latency['count']} turns)"
+        )
+
     st.divider()
 
     # Voice selector with modern styling
-    st.markdown("""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h3 style='color: #e0e0e0; margin: 0;'>🎙️ Voice Selection</h3>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='section-title'><h3>🎙️ Voice Selection</h3></div>", unsafe_allow_html=True)
 
     # Available voices organized by language and gender
     voices = {
@@ -595,11 +701,7 @@ with st.sidebar:
     st.divider()
 
     # Background music toggle
-    st.markdown("""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h3 style='color: #e0e0e0; margin: 0;'>🎵 Background Music</h3>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='section-title'><h3>🎵 Background Music</h3></div>", unsafe_allow_html=True)
 
     music_toggle = st.checkbox(
         "Play calm background music",
@@ -611,64 +713,32 @@ with st.sidebar:
     st.divider()
 
     # Voice input instructions with modern styling
-    st.markdown("""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h3 style='color: #e0e0e0; margin: 0;'>💡 Voice Tips</h3>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='section-title'><h3>💡 Voice Tips</h3></div>", unsafe_allow_html=True)
 
     st.markdown("""
-    <div style='background: rgba(102, 126, 234, 0.15); padding: 15px; border-radius: 10px; border-left: 3px solid #667eea;'>
-        <p style='margin: 0 0 10px 0; color: #e0e0e0; font-weight: 600;'>✨ How to use:</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>1️⃣ Tap the microphone</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>2️⃣ Speak clearly</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>3️⃣ Tap again to stop</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>4️⃣ Edit if needed</p>
-        <p style='margin: 5px 0 15px 0; color: #c0c0c0; font-size: 0.9rem;'>5️⃣ Hit send</p>
-
-        <p style='margin: 10px 0 5px 0; color: #e0e0e0; font-weight: 600;'>🎯 Best results:</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>🔇 Quiet environment</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>🎤 Close to microphone</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>💬 Short sentences</p>
-        <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>✅ Always verify text!</p>
+    <div class='tips'>
+        <p class='heading'>✨ How to use:</p>
+        <p>1️⃣ Tap the microphone</p>
+        <p>2️⃣ Speak clearly</p>
+        <p>3️⃣ Tap again to stop</p>
+        <p>4️⃣ Edit if needed</p>
+        <p class='last'>5️⃣ Hit send</p>
+
+        <p class='heading'>🎯 Best results:</p>
+        <p>🔇 Quiet environment</p>
+        <p>🎤 Close to microphone</p>
+        <p>💬 Short sentences</p>
+        <p>✅ Always verify text!</p>
     </div>
     """, unsafe_allow_html=True)
 
     st.divider()
 
     # Voice commands help with modern styling
-    st.markdown("""
-        <div style='text-align: center; margin-bottom: 10px;'>
-            <h3 style='color: #e0e0e0; margin: 0;'>🎙️ Voice Commands</h3>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown("<div class='section-title'><h3>🎙️ Voice Commands</h3></div>", unsafe_allow_html=True)
 
     with st.expander("✨ Show available commands"):
-        st.markdown("""
-        <div style='background: rgba(118, 75, 162, 0.15); padding: 15px; border-radius: 10px;'>
-            <p style='margin: 0 0 10px 0; color: #e0e0e0; font-weight: 600;'>🗑️ Clear Chat:</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Clear chat"</p>
-            <p style='margin: 5px 0 15px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Clear conversation"</p>
-
-            <p style='margin: 10px 0 5px 0; color: #e0e0e0; font-weight: 600;'>🎭 Change Personality:</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Change personality to Professional"</p>
-            <p style='margin: 5px 0 15px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Change personality to Clash Royale"</p>
-
-            <p style='margin: 10px 0 5px 0; color: #e0e0e0; font-weight: 600;'>⚡ Voice Speed:</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Speak faster" / "Speed up"</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Speak slower" / "Slow down"</p>
-            <p style='margin: 5px 0 15px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Normal speed"</p>
-
-            <p style='margin: 10px 0 5px 0; color: #e0e0e0; font-weight: 600;'>🎵 Background Music:</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Play music" / "Turn on music"</p>
-            <p style='margin: 5px 0 15px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Stop music" / "Turn off music"</p>
-
-            <p style='margin: 10px 0 5px 0; color: #e0e0e0; font-weight: 600;'>🎤 Change Voice:</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Change voice to female"</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Change voice to male"</p>
-            <p style='margin: 5px 0; color: #c0c0c0; font-size: 0.9rem;'>• "Change voice to British female"</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(command_help_html(), unsafe_allow_html=True)
 
 # Main chat interface with modern header
 # Get current personality details
@@ -690,9 +760,7 @@ st.markdown(f"""
 st.divider()
 
 # Display chat messages
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+render_history(st.session_state.messages)
 
 # Voice input section with modern design
 st.markdown("""
@@ -706,24 +774,7 @@ col1, col2, col3 = st.columns([1, 2, 1])
 
 with col2:
     # Wrap audio recorder in custom HTML container to hide black background
-    st.markdown("""
-        <style>
-        /* Hide the audio recorder's black background box */
-        .audio-wrapper {
-            position: relative;
-            overflow: hidden;
-        }
-        .audio-wrapper > div {
-            background: transparent !important;
-        }
-        /* Target the audio recorder iframe/component directly */
-        .audio-wrapper iframe {
-            background: transparent !important;
-            mix-blend-mode: screen;
-        }
-        </style>
-        <div class="audio-wrapper">
-    """, unsafe_allow_html=True)
+    st.markdown('<div class="audio-wrapper">', unsafe_allow_html=True)
 
     audio_bytes = audio_recorder(
         text="",
@@ -743,78 +794,116 @@ with col2:
 with col2:
     # Process audio when new recording is available
     if audio_bytes:
-        # Use a hash to detect new recordings
-        import hashlib
-        audio_hash = hashlib.md5(audio_bytes).hexdigest()
-
-        if 'last_audio_hash' not in st.session_state or st.session_state.last_audio_hash != audio_hash:
-            st.session_state.last_audio_hash = audio_hash
-
-            with st.spinner("🎧 Transcribing..."):
-                transcribed_text, status, _ = transcribe_audio(audio_bytes, st.session_state.language)
-
-                if status == "success":
-                    # Check for voice commands
-                    command_type, command_value = detect_voice_command(transcribed_text)
-
-                    if command_type == "clear_chat":
-                        st.session_state.messages = []
-                        st.success(f"✨ {command_value}")
-                    elif command_type == "change_personality":
-                        st.session_state.personality = command_value
-                        st.session_state.messages = []
-                        st.success(f"✨ Changed to {command_value}!")
-                    elif command_type == "voice_speed":
-                        st.session_state.voice_speed = command_value
-                        speed_text = "faster" if command_value > 1.3 else "slower" if command_value < 1.3 else "normal"
-                        st.success(f"✨ Voice speed set to {speed_text}!")
-                    elif command_type == "music":
-                        st.session_state.background_music = command_value
-                        music_text = "on" if command_value else "off"
-                        st.success(f"✨ Background music turned {music_text}!")
-                        st.rerun()
-                    elif command_type == "voice_change":
-                        st.session_state.selected_voice = command_value
-                        voice_name = [k for k, v in voices.items() if v == command_value]
-                        if voice_name:
-                            st.success(f"✨ Voice changed to {voice_name[0]}!")
-                        else:
-                            st.success(f"✨ Voice changed!")
-                    else:
-                        # Normal transcription - auto-send the message
-                        st.session_state.auto_send_message = transcribed_text
-                        st.markdown(f"""
-                            <div style='background: rgba(102, 200, 150, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #66c896; margin: 10px 0;'>
-                                <p style='margin: 0; color: #e0e0e0;'>✅ <strong>Heard:</strong> {transcribed_text}</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        st.rerun()
+        # The recorder re-sends the last recording on every rerun - a sampled fingerprint tells a new one apart
+        recording = recording_fingerprint(audio_bytes)
+
+        if st.session_state.get("last_recording") != recording:
+            st.session_state.last_recording = recording
+
+            if not recent_recordings.claim(recording):
+                # Same recording submitted twice, e.g. from a second tab
+                log.debug("Duplicate recording %s ignored", recording[:12])
+            else:
+                interrupt_reply()
+                begin_turn("voice", audio_bytes=len(audio_bytes))
+                # Transcribe on the shared workers - this run ends and the page polls the job
+                speculation = new_speculation() if SPECULATIVE_REPLIES else None
+                start_job("stt", stt.transcribe_job, audio_bytes, st.session_state.language, speculation)
+                if speculation:
+                    prepare_speculation(speculation)
+
+    stt_job = st.session_state.jobs.get("stt")
+    if stt_job and not stt_job.done():
+        wait_for_job(stt_job, "🎧 Transcribing...")
+    elif stt_job:
+        del st.session_state.jobs["stt"]
+        transcribed_text, status, _ = stt_job.result()
+
+        if status == "success":
+            # Check for voice commands
+            with telemetry.span("command_detection"):
+                command_type, command_value = detect_voice_command(transcribed_text)
+            if command_type:
+                telemetry.annotate(command=command_type)
+                end_turn("command")
+
+            if command_type == "clear_chat":
+                clear_chat()
+                st.success(f"✨ {command_value}")
+            elif command_type == "change_personality":
+                st.session_state.personality = command_value
+                clear_chat()
+                st.success(f"✨ Changed to {command_value}!")
+            elif command_type == "voice_speed":
+                st.session_state.voice_speed = command_value
+                speed_text = "faster" if command_value > 1.3 else "slower" if command_value < 1.3 else "normal"
+                st.success(f"✨ Voice speed set to {speed_text}!")
+            elif command_type == "music":
+                st.session_state.background_music = command_value
+                music_text = "on" if command_value else "off"
+                st.success(f"✨ Background music turned {music_text}!")
+                st.rerun()
+            elif command_type == "voice_change":
+                st.session_state.selected_voice = command_value
+                voice_name = [k for k, v in voices.items() if v == command_value]
+                if voice_name:
+                    st.success(f"✨ Voice changed to {voice_name[0]}!")
                 else:
-                    # Show error with modern styling
-                    if status == "silent":
-                        st.markdown("""
-                            <div style='background: rgba(255, 193, 7, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #ffc107; margin: 10px 0;'>
-                                <p style='margin: 0; color: #e0e0e0;'>🔇 <strong>No speech detected</strong> - Try speaking louder</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                    elif status == "no_speech":
-                        st.markdown("""
-                            <div style='background: rgba(33, 150, 243, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #2196f3; margin: 10px 0;'>
-                                <p style='margin: 0; color: #e0e0e0;'>🎤 <strong>Couldn't understand</strong> - Speak more clearly</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                    elif status == "network_error":
-                        st.markdown("""
-                            <div style='background: rgba(244, 67, 54, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #f44336; margin: 10px 0;'>
-                                <p style='margin: 0; color: #e0e0e0;'>🌐 <strong>Network error</strong> - Check your connection</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown("""
-                            <div style='background: rgba(244, 67, 54, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #f44336; margin: 10px 0;'>
-                                <p style='margin: 0; color: #e0e0e0;'>❌ <strong>Error occurred</strong> - Please try again</p>
-                            </div>
-                        """, unsafe_allow_html=True)
+                    st.success(f"✨ Voice changed!")
+            elif command_type == "language_change":
+                st.session_state.language = command_value
+                language_name = [k for k, v in languages.items() if v == command_value]
+                st.success(f"✨ Language changed to {language_name[0] if language_name else command_value}!")
+                st.rerun()
+            else:
+                # Normal transcription - auto-send the message
+                st.session_state.auto_send_message = transcribed_text
+                st.markdown(f"""
+                    <div style='background: rgba(102, 200, 150, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #66c896; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>✅ <strong>Heard:</strong> {transcribed_text}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+                st.rerun()
+        else:
+            end_turn(status)
+
+            # Show error with modern styling
+            if status == "silent":
+                st.markdown("""
+                    <div style='background: rgba(255, 193, 7, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #ffc107; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>🔇 <strong>No speech detected</strong> - Try speaking louder</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            elif status == "no_speech":
+                st.markdown("""
+                    <div style='background: rgba(33, 150, 243, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #2196f3; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>🎤 <strong>Couldn't understand</strong> - Speak more clearly</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            elif status == "unsupported_language":
+                st.markdown("""
+                    <div style='background: rgba(255, 193, 7, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #ffc107; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>🌐 <strong>Language not supported offline</strong> - Pick English (US) or switch speech engines</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            elif status == "backend_unavailable":
+                st.markdown("""
+                    <div style='background: rgba(244, 67, 54, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #f44336; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>🧩 <strong>Offline speech engine not set up</strong> - Install it and its model, or set STT_BACKEND=google</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            elif status == "network_error":
+                st.markdown("""
+                    <div style='background: rgba(244, 67, 54, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #f44336; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>🌐 <strong>Network error</strong> - Check your connection</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.markdown("""
+                    <div style='background: rgba(244, 67, 54, 0.2); padding: 12px; border-radius: 10px; border-left: 4px solid #f44336; margin: 10px 0;'>
+                        <p style='margin: 0; color: #e0e0e0;'>❌ <strong>Error occurred</strong> - Please try again</p>
+                    </div>
+                """, unsafe_allow_html=True)
 
 # Initialize current_input if not exists
 if 'current_input' not in st.session_state:
@@ -851,6 +940,8 @@ if not prompt:  # Only show form if not auto-sending
     if send_button:
         if user_input and user_input.strip():
             prompt = user_input
+            interrupt_reply()
+            begin_turn("text")
             # Clear for next message
             st.session_state.current_input = ""
         else:
@@ -871,141 +962,51 @@ if prompt:
         st.markdown(prompt)
 
     # Generate AI response
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-
-        try:
-            # Get system instruction based on custom personality
-            if st.session_state.custom_personality:
-                # Use custom personality
-                system_instruction = f"""You are {st.session_state.custom_personality}. Fully embody this personality in all your responses.
-Be creative, engaging, and stay in character!
-
-IMPORTANT for natural voice delivery:
-- Use dramatic pauses by adding ellipses (...) before important points
-- Show excitement with exclamation marks when appropriate
-- Vary your sentence structure - mix short punchy sentences with longer flowing ones
-- Use questions to create engagement and suspense
-- Break up long explanations with pauses and emphasis
-- DO NOT use stage directions like *chuckles*, *pauses*, etc. - the voice will naturally convey emotion through the text"""
+    try:
+        # Get system instruction based on custom personality
+        system_instruction = llm.build_system_instruction(st.session_state.custom_personality)
+
+        # Earlier turns that fit the context budget
+        history = build_chat_history(st.session_state.messages[:-1])
+
+        # Repeated prompts under the same personality and context are answered from cache
+        response_cache = get_response_cache()
+        cache_scope = make_scope(system_instruction, history)
+        cached = response_cache.get(prompt, cache_scope) if response_cache else None
+
+        # A voice prompt may already be streaming from while it was transcribed
+        speculative_job = adopt_speculation(prompt, cache_scope)
+        if cached and speculative_job:
+            speculative_job.cancel()
+
+        voice = st.session_state.selected_voice
+        if cached:
+            log.debug("Response cache hit - %s", response_cache.stats())
+            telemetry.annotate(cached=True)
+
+            # Replay the stored speech if it was made with the same voice
+            cached_audio = cached.audio.get(voice)
+            if cached_audio:
+                spoken = SpokenReply(text=cached.text, audio=[cached_audio])
             else:
-                # Default to professional
-                system_instruction = """You are a professional AI assistant with a warm, engaging personality. You provide:
-- Clear, concise, and accurate information
-- Well-structured responses with proper formatting
-- Professional yet conversational tone
-- Thoughtful analysis and recommendations
-- Helpful guidance across various topics
+                spoken = SpokenReply(text=cached.text, voice=voice, pipelined=False)
+        else:
+            # Reuse the shared model for this system instruction
+            chat = llm.start_chat(system_instruction, history)
 
-IMPORTANT for natural voice delivery:
-- Add dramatic pauses using ellipses (...) before key insights
-- Show enthusiasm when explaining exciting concepts with exclamation marks
-- Vary your pace - use short impactful sentences mixed with detailed explanations
-- Use rhetorical questions to engage listeners
-- Add natural emphasis and variation with punctuation
-- DO NOT use stage directions like *pauses*, *enthusiastically*, etc. - let the text speak naturally
-
-Maintain a professional yet expressive demeanor. Be articulate, organized, thorough, and emotionally engaging through your word choice and punctuation alone."""
-
-            # Create model with system instruction
-            model = genai.GenerativeModel(
-                'gemini-2.0-flash-exp',
-                system_instruction=system_instruction
-            )
-
-            # Generate response
-            response = model.generate_content(prompt)
-            full_response = response.text
-
-            # Display response
-            message_placeholder.markdown(full_response)
-
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-
-            # Generate voice response for all personalities
-            if True:  # Always generate voice
-                try:
-                    with st.spinner("🔊 Generating voice..."):
-                        # Remove markdown formatting and stage directions for voice
-                        import re
-                        clean_text = full_response
-
-                        # DEBUG: Log original response
-                        print(f"\n{'='*50}")
-                        print(f"ORIGINAL RESPONSE LENGTH: {len(full_response)} chars")
-                        print(f"FIRST 200 CHARS: {full_response[:200]}")
-                        print(f"LAST 200 CHARS: {full_response[-200:]}")
-                        print(f"{'='*50}\n")
-
-                        # First, handle bold (keep the text inside) - do this BEFORE handling single asterisks
-                        clean_text = re.sub(r'\*\*([^*]+)\*\*', r'\1', clean_text)  # Keep bold text content
-
-                        # Now remove any remaining single asterisks (these are standalone or used for emphasis)
-                        clean_text = re.sub(r'\*', '', clean_text)  # Remove all remaining asterisks
-
-                        # Remove underscores used for italic
-                        clean_text = re.sub(r'_', '', clean_text)  # Remove all underscores
-
-                        # Remove headers, links, code formatting
-                        clean_text = re.sub(r'#+\s*', '', clean_text)   # Remove headers
-                        clean_text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', clean_text)  # Remove links
-                        clean_text = re.sub(r'`+', '', clean_text)      # Remove code formatting
-
-                        # Clean up extra whitespace
-                        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-
-                        # DEBUG: Log cleaned text
-                        print(f"\n{'='*50}")
-                        print(f"CLEANED TEXT LENGTH: {len(clean_text)} chars")
-                        print(f"FIRST 200 CHARS: {clean_text[:200]}")
-                        print(f"LAST 200 CHARS: {clean_text[-200:]}")
-                        print(f"DIFFERENCE: {len(full_response) - len(clean_text)} chars removed")
-                        print(f"{'='*50}\n")
-
-                        # Pass the selected voice
-                        audio_file = text_to_speech(clean_text, st.session_state.selected_voice)
-                        if audio_file and os.path.exists(audio_file):
-                            # Read audio file as bytes
-                            with open(audio_file, 'rb') as f:
-                                audio_bytes = f.read()
-
-                            # Encode to base64 for HTML embedding with autoplay
-                            audio_base64 = base64.b64encode(audio_bytes).decode()
-
-                            # Create auto-playing audio with JavaScript at configured speed
-                            audio_html = f"""
-                            <audio id="response_audio" autoplay>
-                                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                            </audio>
-                            <script>
-                                // Play the audio at configured speed
-                                var audio = document.getElementById('response_audio');
-                                audio.playbackRate = {st.session_state.voice_speed};
-                                audio.play().catch(function(error) {{
-                                    console.log("Autoplay prevented:", error);
-                                }});
-                            </script>
-                            """
-                            st.markdown(audio_html, unsafe_allow_html=True)
-
-                            # Clean up temp file
-                            try:
-                                os.unlink(audio_file)
-                            except Exception as cleanup_error:
-                                print(f"Cleanup error: {cleanup_error}")
-                except Exception as tts_error:
-                    print(f"Voice generation error: {tts_error}")
-                    # Don't show error to user, just skip voice
+            # Generate the response on the shared workers; pipelined speech starts with the first sentence
+            reply_job = speculative_job or start_job("reply", llm.generate_reply, chat, prompt, STREAM_RESPONSES)
+            spoken = SpokenReply(reply_job, voice, pipelined=STREAM_RESPONSES and TTS_PIPELINE)
 
-        except Exception as e:
-            error_message = f"⚠️ Error: {str(e)}"
-            message_placeholder.markdown(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
-            st.rerun()
+        start_reply(spoken, prompt, cache_scope, cached)
+    except Exception as e:
+        fail_reply(e)
 
-    # Don't rerun here - it would clear the audio player
-    # The next user interaction will trigger a rerun naturally
+    # The reply is polled by a fragment, this run ends without waiting for it
+    render_reply(st.session_state.reply)
+elif st.session_state.reply is not None:
+    # Rerun while a reply streams, or after it finished and is still speaking
+    render_reply(st.session_state.reply)
 
 # Background Music Player
 if st.session_state.background_music:
@@ -1045,3 +1046,6 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# The page is on screen - import the deferred SDKs in the background before the first turn needs them
+preload()
@@ -0,0 +1,67 @@
+"""Benchmark: page payload and script time of one rerun
+
+Runs app.py headless with Streamlit's AppTest and totals the serialized size of every element
+the script sends, with the stylesheet served statically and inlined.
+
+Run from the repository root:
+    python -m benchmarks.bench_page_payload [--reruns 10]
+"""
+import argparse
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def walk(node):
+    """Every element node under node, depth first"""
+    for child in getattr(node, "children", {}).values():
+        yield child
+        yield from walk(child)
+
+
+def rerun_payload(reruns):
+    """(total element bytes, markdown bytes, best script seconds) for one rerun of the app"""
+    app = AppTest.from_file(APP_PATH, default_timeout=30)
+    app.run()  # First run warms imports and caches
+    best = float("inf")
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        best = min(best, time.perf_counter() - start)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+
+    total = markdown = 0
+    for node in walk(app._tree):
+        proto = getattr(node, "proto", None)
+        if proto is None or not hasattr(proto, "ByteSize"):
+            continue
+        size = proto.ByteSize()
+        total += size
+        if node.type == "markdown":
+            markdown += size
+    return total, markdown, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=10, help="reruns timed, best is reported")
+    args = parser.parse_args()
+
+    # The app stops before rendering without a key; nothing is sent to Gemini on an idle rerun
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+    from streamlit import config
+
+    for label, static_serving in [("inline stylesheet", False), ("static stylesheet", True)]:
+        config.set_option("server.enableStaticServing", static_serving)
+        total, markdown, seconds = rerun_payload(args.reruns)
+        print(f"{label:<20} {total:8,} bytes per rerun ({markdown:,} in markdown)  "
+              f"script {seconds * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark: resampling recordings to 16 kHz before recognition
+
+Builds a fixture set of synthetic voiced WAV clips at common recorder rates. Each clip is a
+harmonic series under a vowel-like envelope, plus hiss above 8 kHz that must not alias into
+the speech band. For every clip it compares resample() with SpeechRecognition's own rate
+conversion (audioop.ratecv, used by AudioData.get_raw_data) on:
+
+  - latency of the conversion
+  - FLAC upload size, which is what recognize_google sends, before and after
+  - accuracy, as SNR against the same clip synthesized directly at 16 kHz without the hiss
+
+Run from the repository root:
+    python -m benchmarks.bench_resample [--seconds 5] [--repeat 10]
+"""
+import argparse
+import io
+import time
+import wave
+
+import numpy as np
+import speech_recognition as sr
+
+from voice_engine.resample import STT_SAMPLE_RATE, resample
+from voice_engine.vad import read_wav
+
+# (name, sample rate, channels) - the recorder produces 44.1 kHz, browsers and USB mics vary
+FIXTURES = [
+    ("recorder 44.1k mono", 44100, 1),
+    ("recorder 44.1k stereo", 44100, 2),
+    ("usb mic 48k mono", 48000, 1),
+    ("laptop 22.05k mono", 22050, 1),
+]
+
+
+def voiced_signal(times, seed):
+    """Harmonics of a gliding pitch under formant peaks, with syllable-rate amplitude changes"""
+    rng = np.random.default_rng(seed)
+    f0 = 120 + 60 * rng.random()
+    # Pitch glides +-10% at 0.7 Hz; the phase is its exact integral so every rate samples the same wave
+    phase = 2 * np.pi * f0 * (times - 0.1 / (2 * np.pi * 0.7) * np.cos(2 * np.pi * 0.7 * times))
+    formants = rng.uniform([500, 1200, 2500], [800, 1800, 3200])
+
+    signal = np.zeros_like(times)
+    total_gain = 0
+    for harmonic in range(1, int(7000 / (f0 * 1.1))):
+        frequency = harmonic * f0
+        gain = (sum(np.exp(-((frequency - formant) / 300) ** 2) for formant in formants) + 0.05) / harmonic ** 0.5
+        signal += gain * np.sin(harmonic * phase)
+        total_gain += gain
+    syllables = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * times) ** 2
+    return signal * syllables / total_gain
+
+
+def make_fixture(sample_rate, channels, seconds, seed):
+    """(WAV bytes, ideal 16 kHz int16 samples)"""
+    times = np.arange(int(seconds * sample_rate)) / sample_rate
+    rng = np.random.default_rng(seed + 1)
+    hiss = np.sin(2 * np.pi * 11000 * times) * 0.15 if sample_rate > 22050 else 0
+    clip = 0.6 * voiced_signal(times, seed) + hiss + rng.normal(0, 0.002, len(times))
+    pcm = np.round(clip * 30000).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.repeat(pcm, channels).tobytes())
+
+    ideal_times = np.arange(int(seconds * STT_SAMPLE_RATE)) / STT_SAMPLE_RATE
+    ideal = np.round(0.6 * voiced_signal(ideal_times, seed) * 30000).astype(np.int16)
+    return buffer.getvalue(), ideal
+
+
+def snr_db(output, ideal):
+    # Skip the edges, where both converters ramp in from zero
+    length = min(len(output), len(ideal))
+    edge = STT_SAMPLE_RATE // 10
+    output = output[edge:length - edge].astype(np.float64)
+    ideal = ideal[edge:length - edge].astype(np.float64)
+    return 10 * np.log10(np.sum(ideal ** 2) / max(np.sum((output - ideal) ** 2), 1e-9))
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of each fixture clip")
+    parser.add_argument("--repeat", type=int, default=10, help="runs per converter, best is reported")
+    args = parser.parse_args()
+
+    print(f"{args.seconds:g}s clips to {STT_SAMPLE_RATE} Hz, best of {args.repeat} runs")
+    for seed, (name, sample_rate, channels) in enumerate(FIXTURES):
+        wav_bytes, ideal = make_fixture(sample_rate, channels, args.seconds, seed)
+        samples, rate = read_wav(wav_bytes)
+        original = sr.AudioData(samples.astype("<i2").tobytes(), rate, 2)
+
+        ours, ours_seconds = best_of(lambda: resample(samples, rate, STT_SAMPLE_RATE), args.repeat)
+        theirs, theirs_seconds = best_of(
+            lambda: np.frombuffer(original.get_raw_data(convert_rate=STT_SAMPLE_RATE), dtype="<i2"),
+            args.repeat,
+        )
+
+        flac_before = len(original.get_flac_data())
+        flac_after = len(sr.AudioData(ours.astype("<i2").tobytes(), STT_SAMPLE_RATE, 2).get_flac_data())
+
+        print(f"{name} ({len(wav_bytes):,} byte WAV)")
+        print(f"  upload  FLAC {flac_before:,} -> {flac_after:,} bytes ({flac_before / flac_after:.1f}x smaller)")
+        print(f"  resample (numpy polyphase)  {ours_seconds * 1000:7.2f} ms  SNR {snr_db(ours, ideal):5.1f} dB")
+        print(f"  audioop.ratecv              {theirs_seconds * 1000:7.2f} ms  SNR {snr_db(theirs, ideal):5.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Microbenchmark: markdown-to-speech cleaning on large responses
+
+Run from the repository root:
+    python -m benchmarks.bench_speech_cleaner [--size 200000] [--repeat 20]
+"""
+import argparse
+import re
+import time
+
+from voice_engine.speech_cleaner import StreamingCleaner, clean_for_speech
+
+SAMPLE = """## Top **Hog Rider** decks 👑
+
+Here's the thing... the _classic_ 2.6 cycle is still **legendary**! See [RoyaleAPI](https://royaleapi.com) for stats.
+- Hog Rider, Musketeer, Ice Golem 🐗
+- Cannon, Fireball, The Log, Skeletons, Ice Spirit
+1. Cycle fast and out-rotate their counters
+2. Take a `Positive Elixir Trade!` every push
+
+| Card | Elixir |
+|------|-------:|
+| Hog Rider | 4 |
+| Ice Spirit | 1 |
+
+```
+deck = ["hog", "musketeer", "cannon"]
+```
+> Good game, well played! ✨
+"""
+
+# Most replies are plain prose with the odd bold word
+PROSE = ("Positive elixir trade... that's what wins games! When they drop a Mega Knight at the bridge, "
+         "don't panic. Let it come to you, surround it with cheap troops, and punish the other lane. "
+         "**Patience** is the real win condition here.\n\n")
+
+
+def six_pass_clean(text):
+    """The regex chain the reply path used before speech_cleaner, for comparison"""
+    clean_text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
+    clean_text = re.sub(r'\*', '', clean_text)
+    clean_text = re.sub(r'_', '', clean_text)
+    clean_text = re.sub(r'#+\s*', '', clean_text)
+    clean_text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', clean_text)
+    clean_text = re.sub(r'`+', '', clean_text)
+    return re.sub(r'\s+', ' ', clean_text).strip()
+
+
+def streamed_clean(text, chunk_size=40):
+    """Feed the text the way Gemini streams it"""
+    cleaner = StreamingCleaner()
+    pieces = [cleaner.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    pieces.append(cleaner.close())
+    return "".join(pieces)
+
+
+def best_of(function, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000, help="response size in characters")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per cleaner, best is reported")
+    args = parser.parse_args()
+
+    for label, sample in [("markdown-heavy", SAMPLE), ("prose", PROSE)]:
+        text = (sample * (args.size // len(sample) + 1))[:args.size]
+        print(f"{label} response: {len(text):,} chars, best of {args.repeat} runs")
+
+        baseline = best_of(six_pass_clean, text, args.repeat)
+        for name, function in [
+            ("six-pass re.sub chain", six_pass_clean),
+            ("clean_for_speech", clean_for_speech),
+            ("StreamingCleaner (40-char chunks)", streamed_clean),
+        ]:
+            seconds = baseline if function is six_pass_clean else best_of(function, text, args.repeat)
+            print(f"  {name:<36} {seconds * 1000:8.2f} ms  {len(text) / seconds / 1e6:6.1f} Mchar/s  "
+                  f"{baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
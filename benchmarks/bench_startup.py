@@ -0,0 +1,90 @@
+"""Benchmark: cold-start import cost of the app
+
+Runs app.py's top-level import block in a fresh interpreter under `python -X importtime`
+(no Streamlit session is started) and reports:
+
+  - total import time of the block, best of several cold interpreters
+  - the heaviest top-level packages it pulled in, by cumulative time
+  - the same block with every deferred SDK imported up front, as app.py used to
+  - which deferred SDKs were still unloaded afterwards, and what each costs once a turn needs it
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeat 5] [--top 12]
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# SDKs the engine defers until first use (voice_engine.lazy)
+DEFERRED = ["google.generativeai", "speech_recognition", "edge_tts", "numpy"]
+
+
+def app_imports():
+    """Source of the import statements at the top of app.py"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    lines = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(lines)
+
+
+def import_profile(code):
+    """(top-level imports as {name: cumulative us}, modules loaded) for code run in a fresh interpreter"""
+    report = "import sys; print(','.join(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{code}\n{report}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "PRELOAD_SDKS": "false"},
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under their importer and already counted in its time
+        if not name[1:].startswith(" "):
+            timings[name.strip()] = int(cumulative_us)
+    return timings, set(result.stdout.strip().split(","))
+
+
+def total_ms(timings):
+    return sum(timings.values()) / 1000
+
+
+def best_profile(code, repeat):
+    runs = [import_profile(code) for _ in range(repeat)]
+    return min(runs, key=lambda run: total_ms(run[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="cold interpreters per measurement, best is reported")
+    parser.add_argument("--top", type=int, default=12, help="heaviest imports listed")
+    args = parser.parse_args()
+
+    code = app_imports()
+    timings, loaded = best_profile(code, args.repeat)
+    print(f"app.py import block: {total_ms(timings):.0f} ms (best of {args.repeat} cold starts)")
+    eager, _ = best_profile(code + "".join(f"\nimport {name}" for name in DEFERRED), args.repeat)
+    print(f"  with every deferred SDK imported up front: {total_ms(eager):.0f} ms")
+
+    print("heaviest imports:")
+    for name, cumulative in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    print("deferred until first use:")
+    for name in DEFERRED:
+        if name in loaded:
+            print(f"  {name:22} loaded at startup")
+            continue
+        # Imported after the block, the SDK's own entry is what the first turn (or the preload) pays
+        extra, _ = best_profile(f"{code}\nimport {name}", args.repeat)
+        print(f"  {name:22} not loaded, {extra.get(name, 0) / 1000:.0f} ms on first use")
+
+
+if __name__ == "__main__":
+    main()
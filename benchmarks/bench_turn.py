@@ -0,0 +1,231 @@
+"""Benchmark: end-to-end voice turns against local fakes of Gemini, the recognizer and Edge TTS
+
+Everything but the network runs for real: transcribe_audio (WAV decode, resampling, VAD,
+FLAC encoding), the streamed Gemini reply on the shared workers, markdown cleaning and
+sentence-by-sentence synthesize_speech. Turns go through the WebSocket voice API
+(voice_engine.server) with an in-process client. Reported:
+
+  - component latency of transcribe_audio, text_to_speech_bytes and the streamed reply
+  - turn latency from the end of the recording to transcript, first text, first audio and done
+  - throughput with N sessions talking at once
+  - memory held per open session after its turns, traced with tracemalloc
+
+--instant drops the simulated service delays so only the engine's own time is left, which is
+what a CI regression check should look at. --save writes the results as JSON and --baseline
+compares against a saved file, exiting with status 1 when a metric is worse than --tolerance.
+
+Run from the repository root:
+    python -m benchmarks.bench_turn [--sessions 16] [--turns 4] [--instant] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from aiohttp import WSMsgType
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks import fakes
+from benchmarks.bench_resample import make_fixture
+from voice_engine import llm, server, stt, tts
+from voice_engine.workers import get_workers
+
+# Audio sent per WebSocket frame, about 50 ms of 44.1 kHz 16-bit mono
+FRAME_BYTES = 4096
+
+# Result name -> (higher is better, change too small to count as a regression). The floor
+# keeps scheduler jitter on millisecond-scale instant runs from failing the check
+METRICS = {
+    "transcribe_ms": (False, 5),
+    "text_to_speech_ms": (False, 5),
+    "reply_ms": (False, 5),
+    "turn_p50_ms": (False, 5),
+    "turn_p95_ms": (False, 10),
+    "first_audio_p50_ms": (False, 5),
+    "first_audio_p95_ms": (False, 10),
+    "turns_per_second": (True, 0),
+    "memory_per_session_kb": (False, 8),
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def stream_reply():
+    chat = llm.start_chat(llm.build_system_instruction(""))
+    return get_workers().submit("reply", llm.generate_reply, chat, "Which deck should I play?").result()
+
+
+async def voice_turn(ws, wav_bytes):
+    """Send one recording and time the reply's milestones, in ms from the end of the upload"""
+    await ws.send_json({"type": "start", "format": "wav"})
+    for start in range(0, len(wav_bytes), FRAME_BYTES):
+        await ws.send_bytes(wav_bytes[start:start + FRAME_BYTES])
+    await ws.send_json({"type": "end"})
+
+    started = time.perf_counter()
+    timings = {}
+    while True:
+        message = await ws.receive()
+        elapsed = (time.perf_counter() - started) * 1000
+        if message.type == WSMsgType.BINARY:
+            timings.setdefault("first_audio", elapsed)
+            continue
+        if message.type != WSMsgType.TEXT:
+            raise RuntimeError(f"Connection closed mid-turn: {message.type.name}")
+        event = json.loads(message.data)
+        if event["type"] == "error" or event.get("status", "success") != "success":
+            raise RuntimeError(f"Turn failed: {event}")
+        if event["type"] == "done":
+            timings["done"] = elapsed
+            return timings
+        if event["type"] == "transcript":
+            timings["transcript"] = elapsed
+        elif event["type"] == "text":
+            timings.setdefault("first_text", elapsed)
+
+
+async def run_sessions(client, wav_bytes, sessions, turns):
+    """Every turn's timings and the wall time for that many sessions talking at once"""
+    async def session():
+        ws = await client.ws_connect("/ws")
+        try:
+            return [await voice_turn(ws, wav_bytes) for _ in range(turns)]
+        finally:
+            await ws.close()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(session() for _ in range(sessions)))
+    return [timings for turns_done in results for timings in turns_done], time.perf_counter() - started
+
+
+async def memory_per_session(client, wav_bytes, sessions, turns):
+    """Bytes traced per open session after its turns, leaving out the test client's own buffers"""
+    exclude = [tracemalloc.Filter(False, "*aiohttp/client*"), tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(exclude)
+        sockets = [await client.ws_connect("/ws") for _ in range(sessions)]
+        for _ in range(turns):
+            await asyncio.gather(*(voice_turn(ws, wav_bytes) for ws in sockets))
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(exclude)
+        grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        for ws in sockets:
+            await ws.close()
+        return grown / sessions
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_turns(args, wav_bytes):
+    app = server.create_app(max_connections=args.sessions)
+    async with TestClient(TestServer(app)) as client:
+        await run_sessions(client, wav_bytes, 1, 1)  # Warm imports, filters and the worker pool
+
+        single, _ = await run_sessions(client, wav_bytes, 1, args.turns * 2)
+        concurrent, seconds = await run_sessions(client, wav_bytes, args.sessions, args.turns)
+        memory = await memory_per_session(client, wav_bytes, args.sessions, args.turns)
+    return single, concurrent, seconds, memory
+
+
+def check_regressions(results, baseline, tolerance):
+    """Names and messages of metrics worse than the baseline by more than tolerance"""
+    regressions = []
+    for name, (higher_is_better, floor) in METRICS.items():
+        if name not in baseline or name not in results:
+            continue
+        old, new = baseline[name], results[name]
+        if higher_is_better:
+            worse = new < old * (1 - tolerance) - floor
+        else:
+            worse = new > old * (1 + tolerance) + floor
+        if worse:
+            regressions.append(f"{name}: {old:.1f} -> {new:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=16, help="sessions talking at once")
+    parser.add_argument("--turns", type=int, default=4, help="turns per session")
+    parser.add_argument("--seconds", type=float, default=3.0, help="length of the recording")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per component, median is reported")
+    parser.add_argument("--instant", action="store_true", help="no simulated service delays")
+    parser.add_argument("--save", metavar="FILE", help="write the results to this JSON file")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against results saved earlier")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    timing = fakes.FakeTiming.instant() if args.instant else fakes.FakeTiming()
+    wav_bytes, _ = make_fixture(44100, 1, args.seconds, seed=0)
+
+    with fakes.installed(timing):
+        results = {
+            "transcribe_ms": median_ms(lambda: stt.transcribe_audio(wav_bytes), args.repeat),
+            "text_to_speech_ms": median_ms(lambda: tts.text_to_speech_bytes(fakes.CANNED_REPLY), args.repeat),
+            "reply_ms": median_ms(stream_reply, args.repeat),
+        }
+        single, concurrent, seconds, memory = asyncio.run(bench_turns(args, wav_bytes))
+
+    done = [timings["done"] for timings in single]
+    first_audio = [timings["first_audio"] for timings in single]
+    results.update({
+        "turn_p50_ms": percentile(done, 0.5),
+        "turn_p95_ms": percentile(done, 0.95),
+        "first_audio_p50_ms": percentile(first_audio, 0.5),
+        "first_audio_p95_ms": percentile(first_audio, 0.95),
+        "turns_per_second": len(concurrent) / seconds,
+        "memory_per_session_kb": memory / 1024,
+    })
+    concurrent_done = [timings["done"] for timings in concurrent]
+
+    mode = "instant fakes" if args.instant else "simulated service delays"
+    print(f"{args.seconds:g}s recording, {mode}")
+    print(f"  transcribe_audio      {results['transcribe_ms']:8.1f} ms")
+    print(f"  text_to_speech_bytes  {results['text_to_speech_ms']:8.1f} ms  ({len(fakes.CANNED_REPLY)} chars)")
+    print(f"  streamed reply        {results['reply_ms']:8.1f} ms")
+    print(f"one session, {len(single)} turns (p50 / p95 from end of recording)")
+    for milestone in ("transcript", "first_text", "first_audio", "done"):
+        values = [timings[milestone] for timings in single]
+        print(f"  {milestone:12} {percentile(values, 0.5):8.1f} / {percentile(values, 0.95):8.1f} ms")
+    print(f"{args.sessions} sessions x {args.turns} turns at once")
+    print(f"  {results['turns_per_second']:.1f} turns/s, turn p50 / p95 "
+          f"{percentile(concurrent_done, 0.5):.1f} / {percentile(concurrent_done, 0.95):.1f} ms")
+    print(f"  {results['memory_per_session_kb']:.1f} KiB held per open session")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%} of {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Local stand-ins for Gemini, the speech recognizer and Edge TTS, for offline benchmarks
+
+The fakes replace the SDKs underneath the engine, so the real transcribe_audio, reply
+pipeline and synthesize_speech code runs and only the network calls are simulated:
+
+    with fakes.installed(fakes.FakeTiming()):
+        text, status, _ = stt.transcribe_audio(wav_bytes)
+
+Delays are slept, not computed, so they model waiting on a service without using CPU.
+FakeTiming.instant() removes every delay, leaving only the engine's own CPU cost.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from voice_engine import llm, speech_pipeline, stt_backends
+from voice_engine.chat_context import CHARS_PER_TOKEN
+
+# Edge TTS default output, audio-24khz-48kbitrate-mono-mp3: one MPEG-2 Layer III frame is
+# 576 samples (24 ms) in 144 bytes. The header is valid, the body is silence.
+MP3_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC4]) + bytes(140)
+MP3_FRAME_SECONDS = 576 / 24000
+
+# Speech at Edge TTS's default rate, used to size the fake audio
+SPOKEN_CHARS_PER_SECOND = 14
+
+CANNED_REPLY = (
+    "Great question... here's the short version! **Hog Rider** decks win by cycling fast and "
+    "taking positive elixir trades. Keep your cheap spells for their swarm, and never overcommit "
+    "in single elixir. Want me to suggest a deck for your arena?\n\n"
+    "- Hog Rider, Musketeer, Ice Golem\n- Cannon, Fireball, The Log\n\n"
+    "Play it patiently and you'll climb in no time!"
+)
+
+
+@dataclass
+class FakeTiming:
+    """How fast the fake services answer"""
+
+    stt_latency: float = 0.35  # Recognition round trip, on top of FLAC encoding
+    first_token: float = 0.45  # Gemini time to first chunk
+    tokens_per_second: float = 60.0  # Gemini streaming rate after the first chunk
+    chunk_tokens: int = 8  # Tokens per streamed chunk
+    tts_first_byte: float = 0.15  # Edge TTS time to first audio chunk
+    tts_realtime: float = 10.0  # Edge TTS produces audio this many times faster than it plays
+
+    @classmethod
+    def instant(cls):
+        return cls(0, 0, 0, 8, 0, 0)
+
+
+def _sleep_for(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Streamed reply: chunks of reply text arriving at the configured token rate"""
+
+    def __init__(self, text, timing, stream):
+        self._text = text
+        self._timing = timing
+        self._stream = stream
+
+    def __iter__(self):
+        timing = self._timing
+        chunk_chars = timing.chunk_tokens * CHARS_PER_TOKEN
+        _sleep_for(timing.first_token)
+        for start in range(0, len(self._text), chunk_chars):
+            if start and timing.tokens_per_second:
+                _sleep_for(timing.chunk_tokens / timing.tokens_per_second)
+            yield FakeChunk(self._text[start:start + chunk_chars])
+
+    @property
+    def text(self):
+        if not self._stream:
+            for _ in self:
+                pass  # A non-streamed call waits for the whole reply
+        return self._text
+
+
+class FakeChat:
+    def __init__(self, timing, reply, history):
+        self._timing = timing
+        self._reply = reply
+        self.history = list(history or [])
+
+    def send_message(self, prompt, stream=False):
+        self.history.append({"role": "user", "parts": [prompt]})
+        self.history.append({"role": "model", "parts": [self._reply]})
+        return FakeResponse(self._reply, self._timing, stream)
+
+
+class FakeModel:
+    def __init__(self, timing, reply):
+        self._timing = timing
+        self._reply = reply
+
+    def start_chat(self, history=None):
+        return FakeChat(self._timing, self._reply, history)
+
+
+class FakeGenAI:
+    """Stands in for the google.generativeai module behind llm.genai"""
+
+    def __init__(self, timing, reply=CANNED_REPLY):
+        self._timing = timing
+        self._reply = reply
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerativeModel(self, model_name, system_instruction=None):
+        return FakeModel(self._timing, self._reply)
+
+
+class FakeRecognizerBackend(stt_backends.RecognizerBackend):
+    """STT backend that encodes the upload like the Google backend, then waits instead of sending it"""
+
+    name = "fake"
+    transcript = "what deck should I play with hog rider"
+
+    def __init__(self, timing=None):
+        self.timing = timing or FakeTiming()
+
+    def recognize(self, recognizer, audio_data, language, on_partial=None):
+        audio_data.get_flac_data()  # recognize_google's CPU cost before the request goes out
+        _sleep_for(self.timing.stt_latency)
+        return self.transcript
+
+
+class FakeCommunicate:
+    """edge_tts.Communicate that streams silent MP3 frames, as long as the text takes to say"""
+
+    timing = FakeTiming()
+
+    def __init__(self, text, voice, rate="+0%", pitch="+0Hz", volume="+0%"):
+        self.text = text
+
+    async def stream(self):
+        timing = self.timing
+        if timing.tts_first_byte:
+            await asyncio.sleep(timing.tts_first_byte)
+        frames = max(int(len(self.text) / SPOKEN_CHARS_PER_SECOND / MP3_FRAME_SECONDS), 1)
+        per_chunk = 20  # Edge sends audio a few frames at a time
+        for start in range(0, frames, per_chunk):
+            count = min(per_chunk, frames - start)
+            if timing.tts_realtime:
+                await asyncio.sleep(count * MP3_FRAME_SECONDS / timing.tts_realtime)
+            yield {"type": "audio", "data": MP3_FRAME * count}
+        yield {"type": "WordBoundary", "offset": 0, "duration": 0, "text": self.text[:20]}
+
+
+class FakeEdgeTTS:
+    """Stands in for the edge_tts module behind speech_pipeline.edge_tts"""
+
+    def __init__(self, timing):
+        self.Communicate = type("Communicate", (FakeCommunicate,), {"timing": timing})
+
+
+@contextmanager
+def installed(timing=None):
+    """Swap the fakes in for Gemini, the STT backend and Edge TTS, with the TTS cache off"""
+    timing = timing or FakeTiming()
+    saved = (
+        llm.genai, llm._api_key, speech_pipeline.edge_tts, speech_pipeline.get_tts_cache,
+        stt_backends.STT_BACKEND, dict(stt_backends._backends),
+    )
+
+    llm.genai = FakeGenAI(timing)
+    llm.configure("fake-key")
+    llm._models.clear()
+    speech_pipeline.edge_tts = FakeEdgeTTS(timing)
+    speech_pipeline.get_tts_cache = lambda: None  # Every sentence is synthesized, as on a cold cache
+    stt_backends.BACKENDS[FakeRecognizerBackend.name] = lambda: FakeRecognizerBackend(timing)
+    stt_backends._backends.pop(FakeRecognizerBackend.name, None)
+    stt_backends.STT_BACKEND = FakeRecognizerBackend.name
+    try:
+        yield timing
+    finally:
+        (llm.genai, api_key, speech_pipeline.edge_tts, speech_pipeline.get_tts_cache,
+         stt_backends.STT_BACKEND, backends) = saved
+        llm.configure(api_key)
+        stt_backends._backends.clear()
+        stt_backends._backends.update(backends)
+        stt_backends.BACKENDS.pop(FakeRecognizerBackend.name, None)
+        llm._models.clear()
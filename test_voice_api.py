@@ -0,0 +1,261 @@
+"""Test the WebSocket voice API with stub STT, Gemini and TTS (no network or API key needed)
+
+Run with pytest, or directly: python test_voice_api.py
+"""
+import asyncio
+import io
+import json
+import threading
+import wave
+
+from aiohttp import WSMsgType
+from aiohttp.test_utils import TestClient, TestServer
+
+from voice_engine import server
+
+REPLY = ["You said something worth answering. ", "Here is a second sentence for you. ", "**Bye** now"]
+
+
+class StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubResponse:
+    """Streamed reply: iterates chunks, .text is the whole reply like the Gemini SDK"""
+
+    def __iter__(self):
+        return (StubChunk(part) for part in REPLY)
+
+    @property
+    def text(self):
+        return "".join(REPLY)
+
+
+class StubChat:
+    def send_message(self, prompt, stream=False):
+        return StubResponse()
+
+
+class StubServices(server.Services):
+    """Records what reached each stage instead of calling Google and Edge"""
+
+    def __init__(self):
+        super().__init__(self.transcribe, self.start_chat, self.synthesize)
+        self.recordings = []
+
+    def transcribe(self, wav_bytes, language, on_partial):
+        self.recordings.append(wav_bytes)
+        on_partial("hello")
+        return "hello world", "success", None
+
+    def start_chat(self, system_instruction, history):
+        return StubChat()
+
+    async def synthesize(self, text, voice):
+        return f"MP3[{text}]".encode()
+
+
+async def receive_turn(ws):
+    """JSON messages and audio frames sent for one turn, up to its done, error or failed transcript"""
+    events, audio = [], []
+    while True:
+        message = await ws.receive(timeout=5)
+        if message.type == WSMsgType.BINARY:
+            audio.append(message.data)
+            continue
+        assert message.type == WSMsgType.TEXT, message
+        event = json.loads(message.data)
+        events.append(event)
+        if event["type"] in ("done", "error"):
+            return events, audio
+        if event["type"] == "transcript" and event["status"] != "success":
+            return events, audio
+
+
+def run_with_client(scenario, max_connections=4):
+    services = StubServices()
+
+    async def run():
+        app = server.create_app(services, max_connections=max_connections)
+        async with TestClient(TestServer(app)) as client:
+            await scenario(client, services)
+
+    asyncio.run(run())
+    return services
+
+
+def test_text_turn():
+    async def scenario(client, services):
+        ws = await client.ws_connect("/ws")
+        await ws.send_json({"type": "text", "text": "hi there"})
+        events, audio = await receive_turn(ws)
+        await ws.close()
+
+        done = events[-1]
+        assert done["type"] == "done"
+        assert done["text"] == "".join(REPLY)
+        assert "".join(e["text"] for e in events if e["type"] == "text") == done["text"]
+        assert done["audio_segments"] == len(audio) == 3
+        assert audio[-1] == b"MP3[Bye now]"  # Markdown cleaned before speaking
+        assert services.recordings == []
+
+    run_with_client(scenario)
+
+
+def test_empty_text_is_an_error():
+    async def scenario(client, services):
+        ws = await client.ws_connect("/ws")
+        await ws.send_json({"type": "text", "text": "  "})
+        events, audio = await receive_turn(ws)
+        await ws.close()
+        assert events == [{"type": "error", "error": "empty text"}] and audio == []
+
+    run_with_client(scenario)
+
+
+def test_audio_is_sent_while_the_reply_streams():
+    first_audio_received = threading.Event()
+
+    class SlowResponse(StubResponse):
+        def __iter__(self):
+            yield StubChunk(REPLY[0])
+            first_audio_received.wait(2)  # Gemini is still writing until the client has the first sentence
+            yield from (StubChunk(part) for part in REPLY[1:])
+
+    class SlowChat:
+        def send_message(self, prompt, stream=False):
+            return SlowResponse()
+
+    async def scenario(client, services):
+        services.start_chat = lambda system_instruction, history: SlowChat()
+        ws = await client.ws_connect("/ws")
+        await ws.send_json({"type": "text", "text": "hi there"})
+        streamed = []
+        while (message := await ws.receive(timeout=5)).type == WSMsgType.TEXT:
+            streamed.append(json.loads(message.data)["text"])
+        first_audio_received.set()
+        events, audio = await receive_turn(ws)
+        await ws.close()
+
+        # The first sentence was spoken before the second one arrived
+        assert streamed == [REPLY[0]]
+        assert message.data.startswith(b"MP3[You said")
+        assert events[-1]["type"] == "done" and len(audio) == 2
+
+    run_with_client(scenario)
+
+
+def test_barge_in_keeps_the_history_paired():
+    class RecordingSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send_str(self, data):
+            self.sent.append(json.loads(data))
+
+        async def send_bytes(self, data):
+            self.sent.append(data)
+
+    class SlowServices(StubServices):
+        async def synthesize(self, text, voice):
+            await asyncio.sleep(0.3)  # The first reply is still speaking when the second prompt arrives
+            return await super().synthesize(text, voice)
+
+    async def scenario():
+        session = server.VoiceSession(RecordingSocket(), SlowServices())
+        session.start_writer()
+        await session.handle_text({"type": "text", "text": "first prompt"})
+        await asyncio.sleep(0.1)
+        await session.handle_text({"type": "text", "text": "second prompt"})
+        await session.turn
+        await session.close()
+        return session
+
+    session = asyncio.run(scenario())
+    assert [(m["role"], m["content"]) for m in session.messages] == [
+        ("user", "second prompt"), ("assistant", "".join(REPLY)),
+    ]
+
+
+def test_pcm16_voice_turn():
+    pcm = b"\x01\x00" * 16000  # One second of 16 kHz audio
+
+    async def scenario(client, services):
+        ws = await client.ws_connect("/ws")
+        await ws.send_json({"type": "start", "format": "pcm16", "sample_rate": 16000})
+        for start in range(0, len(pcm), 4096):
+            await ws.send_bytes(pcm[start:start + 4096])
+        await ws.send_json({"type": "end"})
+        events, audio = await receive_turn(ws)
+        await ws.close()
+
+        kinds = [e["type"] for e in events]
+        assert kinds[:2] == ["partial", "transcript"]
+        assert events[1] == {"type": "transcript", "text": "hello world", "status": "success"}
+        assert kinds[-1] == "done" and len(audio) == 3
+
+    services = run_with_client(scenario)
+
+    # The frames reached STT as one WAV with the rate the client declared
+    assert len(services.recordings) == 1
+    with wave.open(io.BytesIO(services.recordings[0])) as wav:
+        assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (1, 2, 16000)
+        assert wav.readframes(wav.getnframes()) == pcm
+
+
+def test_oversized_audio_is_rejected():
+    saved = server.MAX_AUDIO_BYTES
+    server.MAX_AUDIO_BYTES = 1000
+
+    async def scenario(client, services):
+        ws = await client.ws_connect("/ws")
+        await ws.send_json({"type": "start"})
+        for _ in range(3):
+            await ws.send_bytes(b"\x01" * 600)
+        await ws.send_json({"type": "end"})
+        assert json.loads((await ws.receive(timeout=5)).data) == {"type": "error", "error": "audio_too_large"}
+        assert json.loads((await ws.receive(timeout=5)).data) == {
+            "type": "transcript", "text": "", "status": "audio_too_large"
+        }
+        assert services.recordings == []
+
+        # The next utterance is accepted again
+        await ws.send_json({"type": "start"})
+        await ws.send_bytes(b"\x01" * 600)
+        await ws.send_json({"type": "end"})
+        events, _ = await receive_turn(ws)
+        await ws.close()
+        assert events[-1]["type"] == "done"
+        assert len(services.recordings) == 1
+
+    try:
+        run_with_client(scenario)
+    finally:
+        server.MAX_AUDIO_BYTES = saved
+
+
+def test_busy_server_returns_503():
+    async def scenario(client, services):
+        ws = await client.ws_connect("/ws")
+        response = await client.get("/ws")
+        assert response.status == 503
+        assert await (await client.get("/health")).json() == {"connections": 1, "max_connections": 1}
+
+        await ws.close()
+        await asyncio.sleep(0.05)  # Let the handler see the close
+        assert (await (await client.get("/health")).json())["connections"] == 0
+
+    run_with_client(scenario, max_connections=1)
+
+
+if __name__ == "__main__":
+    tests = (
+        test_text_turn, test_empty_text_is_an_error, test_audio_is_sent_while_the_reply_streams,
+        test_barge_in_keeps_the_history_paired, test_pcm16_voice_turn,
+        test_oversized_audio_is_rejected, test_busy_server_returns_503,
+    )
+    for test in tests:
+        test()
+        print(f"✓ {test.__name__}")
+    print("\nAll voice API tests passed!")
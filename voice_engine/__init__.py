@@ -0,0 +1,41 @@
+"""Voice assistant engine: speech recognition, Gemini replies, speech synthesis and voice commands
+
+Importing the package is cheap - each service and the SDK behind it loads on first use, so
+workers, scripts and benchmarks can run the pipeline without Streamlit:
+
+    import voice_engine
+
+    voice_engine.configure(api_key)
+    text, status, _ = voice_engine.transcribe_audio(wav_bytes, "en-US")
+"""
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "configure": "llm",
+    "build_system_instruction": "llm",
+    "get_model": "llm",
+    "start_chat": "llm",
+    "generate_reply": "llm",
+    "transcribe_audio": "stt",
+    "text_to_speech_bytes": "tts",
+    "text_to_speech": "tts",
+    "detect_voice_command": "commands",
+    "clean_for_speech": "speech_cleaner",
+    "get_workers": "workers",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,74 @@
+"""Token-budgeted conversation history for multi-turn Gemini chats"""
+import os
+
+# Approximate token budget for earlier turns sent with each prompt (0 sends only the prompt)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2000"))
+
+# Summarize turns that fall out of the window instead of dropping them (costs an extra Gemini call)
+CHAT_SUMMARIZE = os.getenv("CHAT_SUMMARIZE", "false").lower() == "true"
+
+# Rough English average - counting exactly would cost a round trip per turn
+CHARS_PER_TOKEN = 4
+
+# Failed replies are stored in the chat as assistant messages starting with this
+ERROR_PREFIX = "⚠️ Error:"
+
+SUMMARY_INSTRUCTION = """You condense conversations. Summarize the conversation you are given in at most five sentences.
+Keep names, numbers, decisions and open questions. Write plain text without markdown."""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate from character count"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _completed_turns(messages):
+    # Drop failed replies together with the prompt that caused them, so roles keep alternating
+    turns = []
+    for message in messages:
+        if message["role"] == "assistant" and message["content"].startswith(ERROR_PREFIX):
+            if turns and turns[-1]["role"] == "user":
+                turns.pop()
+            continue
+        turns.append(message)
+    return turns
+
+
+def window_history(messages, max_tokens):
+    """Split earlier messages into (older, recent) where recent is the newest part that fits the budget"""
+    turns = _completed_turns(messages)
+
+    used = 0
+    start = len(turns)
+    while start > 0:
+        cost = estimate_tokens(turns[start - 1]["content"])
+        if used + cost > max_tokens:
+            break
+        used += cost
+        start -= 1
+
+    # Gemini history has to open with a user turn
+    while start < len(turns) and turns[start]["role"] != "user":
+        start += 1
+
+    return turns[:start], turns[start:]
+
+
+def to_gemini_history(messages, summary=""):
+    """Chat messages in the contents format start_chat expects, led by the running summary if any"""
+    history = []
+    if summary:
+        history.append({"role": "user", "parts": [f"Summary of our earlier conversation: {summary}"]})
+        history.append({"role": "model", "parts": ["Got it, I'll keep that in mind."]})
+    for message in messages:
+        role = "model" if message["role"] == "assistant" else "user"
+        history.append({"role": role, "parts": [message["content"]]})
+    return history
+
+
+def summarize_turns(model, messages, previous_summary=""):
+    """Fold messages into the running summary with one Gemini call"""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n\n{transcript}"
+    return model.generate_content(transcript).text.strip()
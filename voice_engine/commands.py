@@ -0,0 +1,173 @@
+"""Declarative voice command registry compiled into a single matcher"""
+import re
+
+
+class VoiceCommand:
+    """A command spoken as any of its trigger phrases
+
+    Commands without arguments return value. Commands with arguments return the value of the
+    most specific (keywords, value) entry whose keywords were all heard, first listed on ties,
+    and don't fire when none was heard.
+    """
+
+    def __init__(self, name, group, triggers, value=None, arguments=(), examples=()):
+        self.name = name
+        self.group = group  # (emoji, title) shown in the sidebar help
+        self.triggers = tuple(triggers)
+        self.value = value
+        self.arguments = tuple(arguments)
+        self.examples = tuple(examples)
+
+    def resolve(self, heard):
+        if not self.arguments:
+            return self.value
+        best_value, best_size = None, 0
+        for keywords, value in self.arguments:
+            if len(keywords) > best_size and all(keyword in heard for keyword in keywords):
+                best_value, best_size = value, len(keywords)
+        return best_value
+
+
+CLEAR_CHAT = ("🗑️", "Clear Chat")
+PERSONALITY = ("🎭", "Change Personality")
+VOICE_SPEED = ("⚡", "Voice Speed")
+MUSIC = ("🎵", "Background Music")
+VOICE = ("🎤", "Change Voice")
+LANGUAGE = ("🌐", "Change Language")
+
+# Checked in this order when one utterance contains several commands
+COMMANDS = [
+    VoiceCommand(
+        "clear_chat", CLEAR_CHAT,
+        ["clear chat", "clear conversation", "delete history"],
+        value="Cleared conversation history!",
+        examples=['"Clear chat"', '"Clear conversation"'],
+    ),
+    VoiceCommand(
+        "change_personality", PERSONALITY,
+        ["change personality", "switch personality"],
+        arguments=[
+            (("clash royale",), "Clash Royale"),
+            (("clash royal",), "Clash Royale"),
+            (("professional",), "Professional"),
+        ],
+        examples=['"Change personality to Professional"', '"Change personality to Clash Royale"'],
+    ),
+    VoiceCommand(
+        "voice_speed", VOICE_SPEED,
+        ["speak faster", "talk faster", "speed up"],
+        value=1.5,
+        examples=['"Speak faster" / "Speed up"'],
+    ),
+    VoiceCommand(
+        "voice_speed", VOICE_SPEED,
+        ["speak slower", "talk slower", "slow down"],
+        value=1.0,
+        examples=['"Speak slower" / "Slow down"'],
+    ),
+    VoiceCommand(
+        "voice_speed", VOICE_SPEED,
+        ["normal speed", "regular speed"],
+        value=1.3,
+        examples=['"Normal speed"'],
+    ),
+    VoiceCommand(
+        "music", MUSIC,
+        ["play music", "start music", "turn on music"],
+        value=True,
+        examples=['"Play music" / "Turn on music"'],
+    ),
+    VoiceCommand(
+        "music", MUSIC,
+        ["stop music", "pause music", "turn off music"],
+        value=False,
+        examples=['"Stop music" / "Turn off music"'],
+    ),
+    VoiceCommand(
+        "voice_change", VOICE,
+        ["change voice", "switch voice"],
+        arguments=[
+            (("british", "female"), "en-GB-SoniaNeural"),
+            (("british", "woman"), "en-GB-SoniaNeural"),
+            (("british",), "en-GB-RyanNeural"),
+            (("female",), "en-US-AriaNeural"),
+            (("woman",), "en-US-AriaNeural"),
+            (("girl",), "en-US-AriaNeural"),
+            (("male",), "en-US-GuyNeural"),
+            (("man",), "en-US-GuyNeural"),
+            (("guy",), "en-US-GuyNeural"),
+        ],
+        examples=['"Change voice to female"', '"Change voice to male"', '"Change voice to British female"'],
+    ),
+    VoiceCommand(
+        "language_change", LANGUAGE,
+        ["change language", "switch language"],
+        arguments=[
+            (("british english",), "en-GB"),
+            (("english",), "en-US"),
+            (("spanish",), "es-ES"),
+            (("french",), "fr-FR"),
+            (("german",), "de-DE"),
+            (("italian",), "it-IT"),
+            (("portuguese",), "pt-PT"),
+            (("chinese",), "zh-CN"),
+            (("mandarin",), "zh-CN"),
+            (("japanese",), "ja-JP"),
+            (("korean",), "ko-KR"),
+            (("hindi",), "hi-IN"),
+            (("arabic",), "ar-SA"),
+        ],
+        examples=['"Change language to Spanish"', '"Switch language to Japanese"'],
+    ),
+]
+
+
+def _compile(commands):
+    # One alternation over every trigger and keyword, longest first so "clash royale" beats "clash royal"
+    phrases = set()
+    triggered_by = {}
+    for index, command in enumerate(commands):
+        for trigger in command.triggers:
+            triggered_by.setdefault(trigger, []).append(index)
+            phrases.add(trigger)
+        for keywords, _ in command.arguments:
+            phrases.update(keywords)
+
+    alternation = "|".join(
+        r"\s+".join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(phrases, key=len, reverse=True)
+    )
+    return re.compile(rf"\b(?:{alternation})\b"), triggered_by
+
+
+MATCHER, TRIGGERED_BY = _compile(COMMANDS)
+
+
+def detect_voice_command(text):
+    """Detect if the transcribed text is a voice command, returning (command, argument) or (None, None)"""
+    if not text:
+        return None, None
+
+    # Single scan collects every phrase heard
+    heard = {" ".join(match.group(0).split()) for match in MATCHER.finditer(text.lower())}
+
+    candidates = sorted({index for phrase in heard for index in TRIGGERED_BY.get(phrase, ())})
+    for index in candidates:
+        command = COMMANDS[index]
+        value = command.resolve(heard)
+        if value is not None:
+            return command.name, value
+
+    return None, None
+
+
+def help_groups():
+    """[(emoji, title, examples)] in registry order for the sidebar help"""
+    groups = []
+    for command in COMMANDS:
+        emoji, title = command.group
+        if groups and groups[-1][1] == title:
+            groups[-1][2].extend(command.examples)
+        else:
+            groups.append((emoji, title, list(command.examples)))
+    return groups
@@ -0,0 +1,79 @@
+"""Deferred imports: heavy SDKs load on first use instead of when the app starts"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from .telemetry import get_logger
+
+log = get_logger("lazy")
+
+# Import the deferred SDKs on a background thread once the first page has rendered, so the
+# first turn doesn't pay for them either (set PRELOAD_SDKS=false to disable)
+PRELOAD_SDKS = os.getenv("PRELOAD_SDKS", "true").lower() != "false"
+
+_deferred = {}  # module name -> LazyModule
+_deferred_lock = threading.Lock()
+_preload_started = False
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access and reuses it after that"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # import_module serializes concurrent imports of the same module and caches it in sys.modules
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "deferred"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Module stand-in for name, shared by every caller; nothing is imported until it is used"""
+    with _deferred_lock:
+        module = _deferred.get(name)
+        if module is None:
+            module = _deferred[name] = LazyModule(name)
+        return module
+
+
+def is_loaded(name):
+    """True once the module has been imported, by a stand-in or anywhere else"""
+    return name in sys.modules
+
+
+def preload():
+    """Import every deferred module on a daemon thread, once per process"""
+    global _preload_started
+    with _deferred_lock:
+        if not PRELOAD_SDKS or _preload_started:
+            return
+        _preload_started = True
+        modules = list(_deferred.values())
+
+    def run():
+        for module in modules:
+            if is_loaded(module._name):
+                continue
+            start = time.perf_counter()
+            try:
+                module._load()
+            except ImportError as e:
+                # Optional SDKs may be missing; the call that needs one reports it
+                log.debug("Preload of %s failed: %s", module._name, e)
+                continue
+            log.debug("Preloaded %s in %.0f ms", module._name, (time.perf_counter() - start) * 1000)
+
+    threading.Thread(target=run, name="sdk-preload", daemon=True).start()
@@ -0,0 +1,114 @@
+"""Gemini service: personalities, shared models and replies for the worker pool"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from . import telemetry
+from .lazy import lazy_import
+
+# The SDK takes about a second to import - it loads when the first model is built
+genai = lazy_import("google.generativeai")
+
+# Gemini model used for replies
+GEMINI_MODEL = 'gemini-2.0-flash-exp'
+
+# Models kept for reuse, one per (model, system instruction)
+MODEL_CACHE_SIZE = 64
+
+_models = OrderedDict()  # (model name, instruction hash) -> GenerativeModel, least recent first
+_models_lock = threading.Lock()
+
+_api_key = None
+_api_key_applied = None  # Key the SDK was last configured with
+
+
+def configure(api_key):
+    """Set the Gemini API key used by every model, passed to the SDK when the first model is built"""
+    global _api_key
+    _api_key = api_key
+
+
+def build_system_instruction(custom_personality):
+    """System prompt for a custom personality, or the default professional one"""
+    if custom_personality:
+        # Use custom personality
+        return f"""You are {custom_personality}. Fully embody this personality in all your responses.
+Be creative, engaging, and stay in character!
+
+IMPORTANT for natural voice delivery:
+- Use dramatic pauses by adding ellipses (...) before important points
+- Show excitement with exclamation marks when appropriate
+- Vary your sentence structure - mix short punchy sentences with longer flowing ones
+- Use questions to create engagement and suspense
+- Break up long explanations with pauses and emphasis
+- DO NOT use stage directions like *chuckles*, *pauses*, etc. - the voice will naturally convey emotion through the text"""
+
+    # Default to professional
+    return """You are a professional AI assistant with a warm, engaging personality. You provide:
+- Clear, concise, and accurate information
+- Well-structured responses with proper formatting
+- Professional yet conversational tone
+- Thoughtful analysis and recommendations
+- Helpful guidance across various topics
+
+IMPORTANT for natural voice delivery:
+- Add dramatic pauses using ellipses (...) before key insights
+- Show enthusiasm when explaining exciting concepts with exclamation marks
+- Vary your pace - use short impactful sentences mixed with detailed explanations
+- Use rhetorical questions to engage listeners
+- Add natural emphasis and variation with punctuation
+- DO NOT use stage directions like *pauses*, *enthusiastically*, etc. - let the text speak naturally
+
+Maintain a professional yet expressive demeanor. Be articulate, organized, thorough, and emotionally engaging through your word choice and punctuation alone."""
+
+
+def get_model(system_instruction, model_name=GEMINI_MODEL):
+    """Shared model for this instruction, constructed on first use and reused by every session"""
+    global _api_key_applied
+    key = (model_name, hashlib.sha256(system_instruction.encode("utf-8")).hexdigest())
+    with _models_lock:
+        if _api_key != _api_key_applied:
+            genai.configure(api_key=_api_key)
+            _api_key_applied = _api_key
+        model = _models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            _models[key] = model
+        _models.move_to_end(key)
+        while len(_models) > MODEL_CACHE_SIZE:
+            _models.popitem(last=False)
+        return model
+
+
+def start_chat(system_instruction, history=None):
+    """Chat session on the shared model, seeded with earlier turns in Gemini's format"""
+    return get_model(system_instruction).start_chat(history=history or [])
+
+
+def generate_reply(job, chat, prompt, stream=True):
+    """Worker: publish each streamed chunk of the reply and return the full text"""
+    started = time.perf_counter()
+    if not stream:
+        text = chat.send_message(prompt).text
+        telemetry.record_span("llm_total", started)
+        return text
+
+    response = chat.send_message(prompt, stream=True)
+    first_token = True
+    for chunk in response:
+        if job.cancelled:
+            return None
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (finish reason / safety metadata only)
+            continue
+        if first_token:
+            telemetry.record_span("llm_first_token", started)
+            first_token = False
+        job.publish(text)
+
+    # The finished stream aggregates every chunk, same text as a non-streamed call
+    telemetry.record_span("llm_total", started)
+    return response.text
@@ -0,0 +1,56 @@
+"""Cheap identity for recordings, to tell a new recording from the one a rerun already handled"""
+import hashlib
+import os
+import threading
+import time
+
+# Sampled blocks hashed per recording; recordings up to BLOCKS * BLOCK_SIZE bytes are hashed whole
+FINGERPRINT_BLOCKS = 8
+FINGERPRINT_BLOCK_SIZE = 4096
+
+# The same recording arriving again within this many seconds, from any session, is a double submission
+RECORDING_DEDUPE_SECONDS = float(os.getenv("RECORDING_DEDUPE_SECONDS", "10"))
+
+
+def recording_fingerprint(audio_bytes):
+    """BLAKE2b of the length plus evenly spaced blocks - constant cost however long the recording is
+
+    Recordings carry microphone noise, so two different ones never share the length and every
+    sampled block.
+    """
+    digest = hashlib.blake2b(str(len(audio_bytes)).encode(), digest_size=16)
+    span = FINGERPRINT_BLOCKS * FINGERPRINT_BLOCK_SIZE
+    if len(audio_bytes) <= span:
+        digest.update(audio_bytes)
+    else:
+        # First block includes the WAV header, the last one the end of the speech
+        stride = (len(audio_bytes) - FINGERPRINT_BLOCK_SIZE) // (FINGERPRINT_BLOCKS - 1)
+        view = memoryview(audio_bytes)
+        for block in range(FINGERPRINT_BLOCKS):
+            start = block * stride
+            digest.update(view[start:start + FINGERPRINT_BLOCK_SIZE])
+    return digest.hexdigest()
+
+
+class RecentRecordings:
+    """Fingerprints handled in the last few seconds, shared by every session in the process"""
+
+    def __init__(self, ttl=RECORDING_DEDUPE_SECONDS):
+        self.ttl = ttl
+        self._seen = {}  # fingerprint -> monotonic time it was claimed
+        self._lock = threading.Lock()
+
+    def claim(self, fingerprint):
+        """True the first time a fingerprint is seen within the TTL, False for a repeat"""
+        now = time.monotonic()
+        with self._lock:
+            # Few recordings arrive per TTL window, so expiring on every claim stays cheap
+            for key in [key for key, seen in self._seen.items() if now - seen > self.ttl]:
+                del self._seen[key]
+            if fingerprint in self._seen:
+                return False
+            self._seen[fingerprint] = now
+            return True
+
+
+recent_recordings = RecentRecordings()
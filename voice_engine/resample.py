@@ -0,0 +1,65 @@
+"""Polyphase resampling of recordings to the rate speech recognizers work at"""
+import os
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Recognizers only use speech up to ~8 kHz; Google accepts 16 kHz FLAC and Vosk models expect it
+STT_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", "16000"))
+
+# Filter taps applied per output sample - more is a sharper anti-aliasing cutoff but slower
+TAPS_PER_PHASE = 64
+
+_filters = {}
+
+
+def _polyphase_filter(up, down, taps_per_phase):
+    # Kaiser-windowed sinc low-pass at the lower Nyquist of the two rates, designed at the
+    # upsampled rate and split into one row of taps per phase
+    key = (up, down, taps_per_phase)
+    if key not in _filters:
+        size = taps_per_phase * up
+        # An odd length puts the centre on a whole sample, where resample() reads it; an even one
+        # would shift the output by half a sample. The spare tap is a trailing zero
+        length = size - 1 + size % 2
+        cutoff = 0.5 / max(up, down) * 0.9  # Cycles per upsampled sample, a little below Nyquist
+        k = np.arange(length) - (length - 1) // 2
+        taps = 2 * cutoff * np.sinc(2 * cutoff * k) * np.kaiser(length, 8.0) * up
+        taps = np.append(taps, np.zeros(size - length))
+        # phases[p, j] = taps[p + (taps_per_phase - 1 - j) * up], reversed to run along the input
+        phases = taps.reshape(taps_per_phase, up).T[:, ::-1]
+        _filters[key] = np.ascontiguousarray(phases, dtype=np.float32)
+    return _filters[key]
+
+
+def resample(samples, from_rate, to_rate=STT_SAMPLE_RATE, taps_per_phase=TAPS_PER_PHASE):
+    """int16 samples at from_rate converted to to_rate, with anti-aliasing"""
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+
+    divisor = gcd(from_rate, to_rate)
+    up, down = to_rate // divisor, from_rate // divisor
+    phases = _polyphase_filter(up, down, taps_per_phase)
+
+    # Zero-padded input so every tap reads a valid index; row s of windows is padded[s:s + taps]
+    padded = np.concatenate([
+        np.zeros(taps_per_phase, dtype=np.float32),
+        samples.astype(np.float32),
+        np.zeros(taps_per_phase, dtype=np.float32),
+    ])
+    windows = sliding_window_view(padded, taps_per_phase)
+
+    output_length = -(-len(samples) * up // down)
+    delay = (taps_per_phase * up - 1) // 2  # Centre tap of the filter, keeps the output aligned with the input
+    output = np.empty(output_length, dtype=np.float32)
+
+    # Outputs up apart share a filter phase and step down input samples, so each phase is one
+    # strided matrix-vector product over the windows - no per-sample gather
+    for first in range(min(up, output_length)):
+        index, phase = divmod(first * down + delay, up)
+        count = len(range(first, output_length, up))
+        rows = windows[index + 1:index + 1 + down * count:down]
+        output[first::up] = rows @ phases[phase]
+
+    return np.clip(np.round(output), -32768, 32767).astype(np.int16)
@@ -0,0 +1,173 @@
+"""Response cache in front of Gemini for repeated prompts under the same personality"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .telemetry import get_logger
+
+log = get_logger("response_cache")
+
+# Number of cached replies and how long they stay valid (set RESPONSE_CACHE_SIZE=0 to disable)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Optional similarity lookup with a local sentence-transformers model, e.g. all-MiniLM-L6-v2
+RESPONSE_CACHE_EMBEDDINGS = os.getenv("RESPONSE_CACHE_EMBEDDINGS", "")
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92"))
+
+APOSTROPHES = re.compile(r"['’]")
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key"""
+    text = APOSTROPHES.sub("", prompt.lower())
+    return WHITESPACE.sub(" ", PUNCTUATION.sub(" ", text)).strip()
+
+
+def make_scope(system_instruction, history=None):
+    """Hash of everything besides the prompt that shapes the reply: personality and earlier turns"""
+    digest = hashlib.sha256(system_instruction.encode("utf-8"))
+    for turn in history or []:
+        digest.update(b"\0" + turn["role"].encode("utf-8"))
+        for part in turn["parts"]:
+            digest.update(b"\0" + str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_embedder(model_name):
+    """Local sentence embedding function, or None when sentence-transformers isn't installed"""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        log.warning("sentence-transformers not installed, using exact matches only")
+        return None
+
+    model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(text):
+        return model.encode(text, normalize_embeddings=True).tolist()
+
+    return embed
+
+
+class CachedResponse:
+    """A stored reply and the speech synthesized for it, per voice"""
+
+    def __init__(self, text, vector=None):
+        self.text = text
+        self.audio = {}
+        self.vector = vector
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """Exact-match (and optional embedding similarity) cache with TTL and LRU eviction"""
+
+    # Embeddings of recent misses kept for put(), so a reply's prompt is only encoded once
+    miss_vectors = 64
+
+    def __init__(self, max_entries, ttl, embed=None, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._embed = embed
+        self._entries = OrderedDict()  # (scope, normalized prompt) -> CachedResponse, least recent first
+        self._missed = OrderedDict()  # (scope, normalized prompt) -> vector of a miss awaiting its reply
+        self._lock = threading.Lock()
+
+    def get(self, prompt, scope):
+        """Return the CachedResponse for this prompt and scope, or None"""
+        normalized = normalize_prompt(prompt)
+        key = (scope, normalized)
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                return self._hit(key)
+            if not self._embed:
+                self.misses += 1
+                return None
+
+        # Embedding takes milliseconds - don't hold the lock for it
+        vector = self._embed(normalized)
+        with self._lock:
+            similar = self._most_similar(scope, vector)
+            if similar is None:
+                self.misses += 1
+                self._missed[key] = vector
+                self._missed.move_to_end(key)
+                while len(self._missed) > self.miss_vectors:
+                    self._missed.popitem(last=False)
+                return None
+            return self._hit(similar)
+
+    def has(self, prompt, scope):
+        """Whether an exact match is cached, without counting a hit or miss"""
+        key = (scope, normalize_prompt(prompt))
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry.created <= self.ttl
+
+    def put(self, prompt, scope, text):
+        """Store a reply, returning its entry so audio can be attached later"""
+        normalized = normalize_prompt(prompt)
+        key = (scope, normalized)
+        with self._lock:
+            vector = self._missed.pop(key, None)  # Embedded by the get() that missed
+        if vector is None and self._embed:
+            vector = self._embed(normalized)
+        entry = CachedResponse(text, vector)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def _expire(self):
+        # Entries are ordered by recency, not age, so check them all - the cache is small
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if now - entry.created > self.ttl]:
+            del self._entries[key]
+
+    def _hit(self, key):
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+
+    def _most_similar(self, scope, vector):
+        best_key, best_score = None, self.similarity
+        for key, entry in self._entries.items():
+            if key[0] != scope or not entry.vector:
+                continue
+            # Embeddings are normalized, so the dot product is the cosine similarity
+            score = sum(a * b for a, b in zip(vector, entry.vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache shared by every session, or None when disabled"""
+    global _cache
+    if RESPONSE_CACHE_SIZE <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            embed = load_embedder(RESPONSE_CACHE_EMBEDDINGS) if RESPONSE_CACHE_EMBEDDINGS else None
+            _cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, embed)
+        return _cache
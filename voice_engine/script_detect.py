@@ -0,0 +1,118 @@
+"""Writing-script detection for picking TTS voices"""
+from bisect import bisect_right
+from collections import Counter
+
+# (first codepoint, last codepoint, script), sorted and non-overlapping
+SCRIPT_RANGES = [
+    (0x0041, 0x005A, "latin"),
+    (0x0061, 0x007A, "latin"),
+    (0x00C0, 0x024F, "latin"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0900, 0x097F, "hindi"),
+    (0x3040, 0x309F, "kana"),
+    (0x30A0, 0x30FF, "kana"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7A3, "korean"),
+]
+RANGE_STARTS = [start for start, _, _ in SCRIPT_RANGES]
+
+# Voice locale prefix that already speaks the script, and the voice to switch to otherwise
+NATIVE_VOICES = {
+    "korean": ("ko-", "ko-KR-InJoonNeural"),
+    "chinese": ("zh-", "zh-CN-YunxiNeural"),
+    "japanese": ("ja-", "ja-JP-KeitaNeural"),
+    "arabic": ("ar-", "ar-SA-HamedNeural"),
+    "hindi": ("hi-", "hi-IN-MadhurNeural"),
+}
+
+
+def classify_char(char):
+    """Script of a character, or None for digits, punctuation, whitespace and emoji"""
+    codepoint = ord(char)
+    index = bisect_right(RANGE_STARTS, codepoint) - 1
+    if index >= 0 and codepoint <= SCRIPT_RANGES[index][1]:
+        return SCRIPT_RANGES[index][2]
+    return None
+
+
+def voice_for_script(script, voice):
+    """Keep the selected voice when it can read the script, otherwise switch to a native one"""
+    if script not in NATIVE_VOICES:
+        return voice
+    prefix, native_voice = NATIVE_VOICES[script]
+    return voice if voice.startswith(prefix) else native_voice
+
+
+def han_script(voice, has_kana):
+    """Language of Han characters: the selected voice's when it reads Han, otherwise Japanese only beside kana"""
+    if voice and voice.startswith(NATIVE_VOICES["japanese"][0]):
+        return "japanese"
+    if voice and voice.startswith(NATIVE_VOICES["chinese"][0]):
+        return "chinese"
+    return "japanese" if has_kana else "chinese"
+
+
+def script_proportions(text, voice=None):
+    """{script: share of letters} over the whole text, from a single counting pass"""
+    counts = {}
+    # Counter walks the text once in C, then only the distinct characters are classified
+    for char, count in Counter(text).items():
+        script = classify_char(char)
+        if script:
+            counts[script] = counts.get(script, 0) + count
+
+    han = han_script(voice, "kana" in counts)
+    for script, cjk in (("han", han), ("kana", "japanese")):
+        if script in counts:
+            counts[cjk] = counts.get(cjk, 0) + counts.pop(script)
+    total = sum(counts.values())
+    return {script: count / total for script, count in counts.items()} if total else {}
+
+
+def split_by_script(text, voice=None):
+    """Split mixed-language text into [(script, segment)] runs, in order, Han resolved for voice"""
+    # One walk over the text, classifying each character once; punctuation, digits and
+    # spaces stay with the run they follow
+    runs = []  # [script, start], han and kana still apart
+    has_kana = False
+    for position, char in enumerate(text):
+        script = classify_char(char)
+        if script is None or (runs and runs[-1][0] == script):
+            continue
+        has_kana = has_kana or script == "kana"
+        runs.append([script, position])
+
+    if not runs:
+        return [(None, text)] if text else []
+
+    # Kanji and hanzi share codepoints, kana is always Japanese. Every run with letters keeps
+    # its script, however short: a word the surrounding voice can't read must still get a
+    # voice that can (speech_segments joins runs sharing a voice)
+    han = han_script(voice, has_kana)
+    merged = []
+    for script, start in runs:
+        if script == "han":
+            script = han
+        elif script == "kana":
+            script = "japanese"
+        if not merged or merged[-1][0] != script:
+            merged.append([script, start])
+
+    segments = []
+    for index, (script, start) in enumerate(merged):
+        start = 0 if index == 0 else start
+        end = merged[index + 1][1] if index + 1 < len(merged) else len(text)
+        segments.append((script, text[start:end]))
+    return segments
+
+
+def speech_segments(text, voice):
+    """[(segment, voice)] for mixed-language text, adjacent segments with the same voice joined"""
+    segments = []
+    for script, segment in split_by_script(text, voice):
+        segment_voice = voice_for_script(script, voice)
+        if segments and segments[-1][1] == segment_voice:
+            segments[-1] = (segments[-1][0] + segment, segment_voice)
+        else:
+            segments.append((segment, segment_voice))
+    return [(segment.strip(), segment_voice) for segment, segment_voice in segments if segment.strip()]
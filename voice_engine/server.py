@@ -0,0 +1,408 @@
+"""WebSocket voice API: the assistant's STT -> Gemini -> Edge TTS pipeline without the Streamlit page
+
+Run from the repository root (needs GEMINI_API_KEY, like the app):
+    python -m voice_engine.server [--host 0.0.0.0] [--port 8765]
+
+One WebSocket per client at /ws, one turn at a time. Client -> server:
+
+    {"type": "start", "format": "pcm16", "sample_rate": 16000}   begin an utterance; "format" is
+                                                                pcm16 (raw mono 16-bit frames) or wav
+    <binary frames>                                             audio for the current utterance
+    {"type": "end"}                                             transcribe it and reply
+    {"type": "text", "text": "..."}                             reply to typed text, skipping STT
+
+"start" and "text" may also set "language", "voice" and "personality" for the rest of the
+connection. A new turn cancels the one still running. Server -> client:
+
+    {"type": "partial", "text": "..."}                          interim transcript (backends that stream)
+    {"type": "transcript", "text": "...", "status": "success"}  final transcript, or the STT status
+                                                                ("audio_too_large" when the utterance
+                                                                went over VOICE_API_MAX_AUDIO_MB)
+    {"type": "text", "text": "..."}                             each streamed chunk of the reply
+    <binary frames>                                             MP3 audio, one frame per spoken sentence
+    {"type": "done", "text": "...", "audio_segments": 3}        the turn is complete
+    {"type": "error", "error": "..."}                           the turn or message failed
+
+GET /health reports open and maximum connections.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import wave
+
+from aiohttp import WSMsgType, web
+
+from . import llm, stt, telemetry
+from .chat_context import CHAT_CONTEXT_TOKENS, ERROR_PREFIX, to_gemini_history, window_history
+from .script_detect import speech_segments
+from .speech_cleaner import StreamingCleaner
+from .speech_pipeline import split_sentences, synthesize_speech
+from .tts import DEFAULT_VOICE
+from .workers import get_workers
+
+log = telemetry.get_logger("server")
+
+# WebSocket clients served at once, later ones get 503 until one disconnects
+MAX_CONNECTIONS = max(int(os.getenv("VOICE_API_MAX_CONNECTIONS", "32")), 1)
+
+# Largest utterance accepted over one connection
+MAX_AUDIO_BYTES = int(float(os.getenv("VOICE_API_MAX_AUDIO_MB", "10")) * 1024 * 1024)
+
+# Sentences of one reply synthesized at once
+TTS_CONCURRENCY = 3
+
+
+class Services:
+    """The pipeline stages the server calls, replaceable with local stubs in tests and benchmarks
+
+    transcribe(wav_bytes, language, on_partial) -> (text, status, _) runs on a worker thread.
+    start_chat(system_instruction, history) -> chat whose send_message(prompt, stream=True)
+    yields chunks with .text, like the Gemini SDK. synthesize(text, voice) is a coroutine
+    returning MP3 bytes.
+    """
+
+    def __init__(self, transcribe=None, start_chat=None, synthesize=None):
+        self.transcribe = transcribe or stt.transcribe_audio
+        self.start_chat = start_chat or llm.start_chat
+        self.synthesize = synthesize or synthesize_speech
+
+
+class Connections:
+    """Open WebSockets against the limit; the handlers all run on one loop, so no lock is needed"""
+
+    def __init__(self, limit):
+        self.open = 0
+        self.limit = limit
+
+
+SERVICES = web.AppKey("services", Services)
+CONNECTIONS = web.AppKey("connections", Connections)
+
+
+def pcm_to_wav(pcm, sample_rate):
+    """Raw mono 16-bit PCM wrapped in a WAV header, the format transcribe_audio reads"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class VoiceSession:
+    """State of one WebSocket connection: settings, the utterance being received and the chat so far"""
+
+    def __init__(self, ws, services):
+        self.ws = ws
+        self.services = services
+        self.language = "en-US"
+        self.voice = DEFAULT_VOICE
+        self.personality = ""
+        self.messages = []  # {"role", "content"} like st.session_state.messages
+        self.audio = bytearray()
+        self.audio_format = "pcm16"
+        self.sample_rate = 16000
+        self.rejected = False  # The utterance outgrew MAX_AUDIO_BYTES, its frames are dropped until the next start
+        self.turn = None  # Task of the turn in progress
+        self._outbox = asyncio.Queue()  # Messages are sent in order by one writer task
+        self._writer = None
+
+    def start_writer(self):
+        self._writer = asyncio.create_task(self.write_messages())
+        self._writer.add_done_callback(self._writer_stopped)
+
+    def _writer_stopped(self, writer):
+        if writer.cancelled():
+            return
+        # Sending failed, e.g. the client vanished mid-reply: nothing more can reach it
+        log.warning("Connection lost while sending: %s", writer.exception())
+        self.cancel_turn()
+
+    async def close(self):
+        """Stop the turn in progress and the writer once the client has gone"""
+        self.cancel_turn()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+    def send(self, message):
+        """Queue a JSON message or binary frame for the client, dropped once the writer has stopped"""
+        if self._writer is not None and self._writer.done():
+            return
+        self._outbox.put_nowait(message)
+
+    async def write_messages(self):
+        while True:
+            message = await self._outbox.get()
+            if isinstance(message, bytes):
+                await self.ws.send_bytes(message)
+            else:
+                await self.ws.send_str(json.dumps(message, ensure_ascii=False))
+
+    def configure(self, message):
+        self.language = message.get("language", self.language)
+        self.voice = message.get("voice", self.voice)
+        self.personality = message.get("personality", self.personality)
+
+    async def handle_text(self, message):
+        kind = message.get("type")
+        if kind == "start":
+            self.configure(message)
+            self.audio = bytearray()
+            self.rejected = False
+            self.audio_format = message.get("format", "pcm16")
+            self.sample_rate = int(message.get("sample_rate", 16000))
+        elif kind == "end":
+            if self.rejected:
+                # The client already had the error, this ends the utterance without a turn
+                self.rejected = False
+                self.send({"type": "transcript", "text": "", "status": "audio_too_large"})
+                return
+            audio = bytes(self.audio)
+            self.audio = bytearray()
+            if self.audio_format == "pcm16":
+                audio = pcm_to_wav(audio, self.sample_rate)
+            self.start_turn("voice", self.voice_turn, audio, audio_bytes=len(audio))
+        elif kind == "text":
+            self.configure(message)
+            text = str(message.get("text", "")).strip()
+            if not text:
+                self.send({"type": "error", "error": "empty text"})
+                return
+            self.start_turn("text", self.reply, text)
+        else:
+            self.send({"type": "error", "error": f"unknown message type {kind!r}"})
+
+    def handle_audio(self, frame):
+        if self.rejected:
+            return
+        if len(self.audio) + len(frame) > MAX_AUDIO_BYTES:
+            # Drop the whole utterance, not just this frame, so a truncated one is never transcribed
+            self.audio = bytearray()
+            self.rejected = True
+            self.send({"type": "error", "error": "audio_too_large"})
+            return
+        self.audio.extend(frame)
+
+    def start_turn(self, kind, handler, argument, **fields):
+        """Run handler(argument) as the next turn, see run_turn"""
+        # Barge-in: a new turn replaces the one still talking, once that one has cleaned up
+        previous = self.turn
+        self.cancel_turn()
+        self.turn = asyncio.create_task(self._after(previous, kind, handler, argument, **fields))
+
+    async def _after(self, previous, *turn, **fields):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])  # Unlike awaiting it, doesn't cancel it again if this turn is
+        return await self.run_turn(*turn, **fields)
+
+    def cancel_turn(self):
+        if self.turn is not None and not self.turn.done():
+            self.turn.cancel()
+
+    async def run_turn(self, kind, handler, argument, **fields):
+        """Await handler(argument) as the current telemetry turn, exported however it ends"""
+        telemetry.start_turn(kind, client="websocket", language=self.language, **fields)
+        status = "error"
+        try:
+            status = await handler(argument)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            telemetry.finish_turn(status)
+
+    async def voice_turn(self, wav_bytes):
+        """Transcribe an utterance and reply to it, returning the turn status"""
+        loop = asyncio.get_running_loop()
+
+        def on_partial(text):
+            loop.call_soon_threadsafe(self.send, {"type": "partial", "text": text})
+
+        job = get_workers().submit("stt", self._transcribe, wav_bytes, self.language, on_partial)
+        try:
+            text, status, _ = await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        self.send({"type": "transcript", "text": text or "", "status": status})
+        if status != "success":
+            return status
+        return await self.reply(text)
+
+    def _transcribe(self, job, wav_bytes, language, on_partial):
+        # Worker thread
+        return self.services.transcribe(wav_bytes, language, on_partial)
+
+    async def reply(self, prompt):
+        """Stream Gemini's reply to prompt as text chunks, speaking each sentence once it is complete
+
+        Returns the turn status, "ok" or "error".
+        """
+        _, recent = window_history(self.messages, CHAT_CONTEXT_TOKENS) if CHAT_CONTEXT_TOKENS > 0 else ([], [])
+        system_instruction = llm.build_system_instruction(self.personality)
+        asked = {"role": "user", "content": prompt}
+        self.messages.append(asked)
+
+        speech = asyncio.Queue()  # Complete sentences for the speaker, None once the reply ends
+        speaker = asyncio.create_task(self.speak(speech))
+        cleaner = StreamingCleaner()
+        buffer = ""
+        job = None
+        try:
+            chat = self.services.start_chat(system_instruction, to_gemini_history(recent))
+            job = get_workers().submit("reply", llm.generate_reply, chat, prompt)
+            async for chunk in job.async_updates():
+                telemetry.mark("first_text")
+                self.send({"type": "text", "text": chunk})
+                with telemetry.span("markdown_cleaning"):
+                    cleaned = cleaner.feed(chunk)
+                sentences, buffer = split_sentences(buffer + cleaned)
+                for sentence in sentences:
+                    speech.put_nowait(sentence)
+            full_response = await asyncio.wrap_future(job.future)
+            buffer += cleaner.close()
+            if buffer.strip():
+                speech.put_nowait(buffer)
+            speech.put_nowait(None)
+            segments = await speaker
+        except asyncio.CancelledError:
+            if job is not None:
+                job.cancel()
+            speaker.cancel()
+            self._forget(asked)
+            raise
+        except Exception as e:
+            log.error("Reply error: %s: %s", type(e).__name__, e)
+            speaker.cancel()
+            # Kept like the app keeps failed replies, so the history window drops the pair
+            self.messages.append({"role": "assistant", "content": f"{ERROR_PREFIX} {str(e)}"})
+            self.send({"type": "error", "error": str(e)})
+            return "error"
+
+        self.messages.append({"role": "assistant", "content": full_response})
+        self.send({"type": "done", "text": full_response, "audio_segments": segments})
+        return "ok"
+
+    def _forget(self, message):
+        # By identity: an equal prompt sent again is a different entry
+        for index, entry in enumerate(self.messages):
+            if entry is message:
+                del self.messages[index]
+                return
+
+    async def speak(self, sentences):
+        """Synthesize queued sentences a few at a time and send their audio in order, until None
+
+        Each sentence's audio goes out as soon as it and the ones before it are ready, while
+        Gemini may still be writing the next sentence.
+        """
+        semaphore = asyncio.Semaphore(TTS_CONCURRENCY)
+
+        async def synthesize(text, voice):
+            async with semaphore:
+                try:
+                    return await self.services.synthesize(text, voice)
+                except Exception as e:
+                    # Skip the sentence rather than dropping the whole reply
+                    log.warning("TTS error: %s: %s", type(e).__name__, e)
+                    return None
+
+        pending = asyncio.Queue()  # Synthesis tasks in speaking order, None after the last
+        tasks = []
+
+        async def send_in_order():
+            sent = 0
+            while (task := await pending.get()) is not None:
+                sent += self._send_audio(await task)
+            return sent
+
+        sender = asyncio.create_task(send_in_order())
+        try:
+            while (sentence := await sentences.get()) is not None:
+                for text, voice in speech_segments(sentence, self.voice):
+                    task = asyncio.create_task(synthesize(text, voice))
+                    tasks.append(task)
+                    pending.put_nowait(task)
+            pending.put_nowait(None)
+            return await sender
+        finally:
+            sender.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def _send_audio(self, audio):
+        if not audio:
+            return 0
+        telemetry.mark("first_audio")
+        self.send(audio)
+        return 1
+
+
+async def websocket_handler(request):
+    connections = request.app[CONNECTIONS]
+    if connections.open >= connections.limit:
+        raise web.HTTPServiceUnavailable(text="Too many voice connections, try again shortly")
+
+    connections.open += 1
+    try:
+        ws = web.WebSocketResponse(heartbeat=30, max_msg_size=MAX_AUDIO_BYTES)
+        await ws.prepare(request)
+        session = VoiceSession(ws, request.app[SERVICES])
+        session.start_writer()
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.BINARY:
+                    session.handle_audio(message.data)
+                elif message.type == WSMsgType.TEXT:
+                    try:
+                        await session.handle_text(json.loads(message.data))
+                    except (ValueError, TypeError, AttributeError) as e:
+                        session.send({"type": "error", "error": f"bad message: {e}"})
+                elif message.type == WSMsgType.ERROR:
+                    log.warning("Connection error: %s", ws.exception())
+        finally:
+            await session.close()
+        return ws
+    finally:
+        connections.open -= 1
+
+
+async def health_handler(request):
+    connections = request.app[CONNECTIONS]
+    return web.json_response({"connections": connections.open, "max_connections": connections.limit})
+
+
+def create_app(services=None, max_connections=MAX_CONNECTIONS):
+    """aiohttp application serving /ws and /health, with stubs passed in as services if given"""
+    app = web.Application()
+    app[SERVICES] = services or Services()
+    # Changed while the app runs, so it is an object of its own rather than app state
+    app[CONNECTIONS] = Connections(max_connections)
+    app.router.add_get("/ws", websocket_handler)
+    app.router.add_get("/health", health_handler)
+    return app
+
+
+def main():
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("VOICE_API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("VOICE_API_PORT", "8765")))
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        parser.exit(1, "GEMINI_API_KEY not found!\n")
+    llm.configure(api_key)
+
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Speculative Gemini replies started from a transcript before the app has rerun with it"""
+import threading
+
+from .response_cache import normalize_prompt
+from .commands import detect_voice_command
+from .telemetry import get_logger
+
+log = get_logger("speculation")
+
+
+class SpeculativeReply:
+    """Reply request opened while a recording is still being handled
+
+    start_reply(prompt) submits the reply and returns its workers.Job, or None to skip it.
+    The STT worker calls offer() with the final transcript and offer_partial() with interim
+    ones; each new wording cancels the previous request. The script adopts the job when the
+    prompt it ends up sending matches.
+
+    Both can be given later with ready(), so transcription starts before the history is
+    built; a transcript offered until then is held and started by ready().
+    """
+
+    def __init__(self, scope=None, start_reply=None):
+        self.scope = scope  # make_scope() of the personality and history the reply was started with
+        self._start_reply = start_reply
+        self._prompt = None
+        self._job = None
+        self._held = None  # Transcript offered before ready()
+        self._last_partial = None
+        self._lock = threading.Lock()
+
+    def ready(self, scope, start_reply):
+        """Set the context replies start in, starting one for a transcript already offered"""
+        with self._lock:
+            self.scope = scope
+            self._start_reply = start_reply
+            held, self._held = self._held, None
+        if held is not None:
+            self.offer(held)
+
+    def offer(self, transcript):
+        """Start the reply for this transcript, unless it's a voice command or already started"""
+        prompt = normalize_prompt(transcript or "")
+        with self._lock:
+            if self._start_reply is None:
+                self._held = transcript
+                return
+            if prompt == self._prompt:
+                return
+            self._cancel_locked()
+            command_type, _ = detect_voice_command(transcript or "")
+            if not prompt or command_type:
+                return  # Commands never reach Gemini
+            self._prompt = prompt
+            self._job = self._start_reply(transcript)
+            if self._job is not None:
+                log.debug("Started reply for: %s", transcript[:80])
+
+    def offer_partial(self, transcript):
+        """Interim text starts the reply once it stops changing - the speaker has paused"""
+        with self._lock:
+            stable = bool(transcript) and transcript == self._last_partial
+            self._last_partial = transcript
+        if stable:
+            self.offer(transcript)
+
+    def adopt(self, prompt, scope):
+        """The running job when it was started for this prompt and context, otherwise cancel it"""
+        with self._lock:
+            if self._job is not None and scope == self.scope and normalize_prompt(prompt) == self._prompt:
+                job, self._job, self._prompt = self._job, None, None
+                return job
+            self._cancel_locked()
+            return None
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        if self._job is not None:
+            self._job.cancel()
+        self._job = None
+        self._prompt = None
+        self._held = None
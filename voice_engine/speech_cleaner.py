@@ -0,0 +1,116 @@
+"""Markdown-to-speech cleaner: strips formatting so the voice doesn't read symbols aloud"""
+import re
+
+# Everything that shouldn't be spoken as one alternation, so the text is scanned once.
+# Single spaces are left alone - only runs and line breaks are normalized.
+MARKDOWN = re.compile(r"""
+    # Cheap first-character filter - most positions are plain text and skip every branch below
+    (?=[\n|\[*+>\#_`~-]|[ \t](?=[ \t\n])|^[ \t]|[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u231A-\u23FF\uFE0F\u200D])
+    (?:
+    (?P<fence>^[ \t]*(?P<fence_mark>```|~~~)[^\n]*\n.*?(?:^[ \t]*(?P=fence_mark)[ \t]*(?:\n|\Z)|\Z))
+  | (?P<rule>^[ \t]*\|?[ \t]*:?-{3,}:?[ \t]*(?:\|[ \t]*:?-{3,}:?[ \t]*)*\|?[ \t]*(?:\n|\Z))
+  | (?P<row>^[ \t]*\|(?P<cells>[^\n]*)\|[ \t]*$)
+  | (?P<link>\[(?P<link_text>[^\]\n]+)\]\([^)\n]*\))
+  | (?P<bullet>^[ \t]*[-*+][ \t]+)
+  | (?P<quote>^[ \t]*>+[ \t]*)
+  | (?P<header>\#+[ \t]*)
+  | (?P<marker>[*_`]+|~~)
+  | (?P<emoji>[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u231A-\u23FF\uFE0F\u200D]+[ \t]*)
+  | (?P<newline>[ \t]*\n\s*)
+  | (?P<spaces>[ \t]{2,})
+    )
+""", re.MULTILINE | re.DOTALL | re.VERBOSE)
+
+
+def _replace(match):
+    kind = match.lastgroup
+    if kind == "link":
+        return match.group("link_text")
+    if kind == "row":
+        # Read table cells as a list: "| a | b |" -> "a, b."
+        cells = [MARKDOWN.sub(_replace, cell).strip() for cell in match.group("cells").split("|")]
+        return ", ".join(cell for cell in cells if cell) + "."
+    if kind == "newline":
+        return "\n"
+    if kind == "spaces":
+        return " "
+    # fence, rule, bullet, quote, header, marker, emoji: drop entirely
+    return ""
+
+
+def clean_for_speech(text):
+    """Strip markdown, code blocks, tables and emoji; line breaks are kept as pauses"""
+    return MARKDOWN.sub(_replace, text).strip()
+
+
+# Inside a partial line, text before the last ". " / "! " / "? " can be cleaned early
+SENTENCE_BREAK = re.compile(r"[.!?]\s")
+
+# Opening or closing line of a code block
+FENCE_LINE = re.compile(r"^[ \t]*(?:```|~~~)", re.MULTILINE)
+
+# Marks the start of a continued line so ^ doesn't treat it as the start of a new one
+CONTINUATION = "\0"
+
+
+class StreamingCleaner:
+    """Clean markdown chunks as they stream in
+
+    feed(chunk) returns cleaned text that later chunks can no longer change and close()
+    returns the rest. Joined, the pieces read the same as clean_for_speech on the whole text.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._mid_line = False  # Buffer continues a line that was partly emitted
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        end = self._safe_end()
+        if end <= 0:
+            return ""
+        ready, self._buffer = self._buffer[:end], self._buffer[end:]
+        cleaned = self._clean(ready)
+        self._mid_line = not ready.endswith("\n")
+        return cleaned
+
+    def close(self):
+        cleaned = self._clean(self._buffer)
+        self._buffer = ""
+        self._mid_line = False
+        return cleaned
+
+    def _clean(self, text):
+        if self._mid_line:
+            text = CONTINUATION + text
+        return MARKDOWN.sub(_replace, text).replace(CONTINUATION, "")
+
+    def _safe_end(self):
+        buffer = self._buffer
+
+        # Hold everything from an unclosed code fence on - it's dropped once closed
+        fence_start = None
+        for match in FENCE_LINE.finditer(buffer):
+            if fence_start is None:
+                fence_start = match.start()
+            elif "\n" in buffer[match.end():]:
+                fence_start = None  # Closing fence line is complete
+        if fence_start is not None:
+            return self._line_safe_end(buffer[:fence_start], fence_start)
+
+        return self._line_safe_end(buffer, len(buffer))
+
+    def _line_safe_end(self, text, limit):
+        # Complete lines are always safe
+        line_end = text.rfind("\n") + 1
+
+        # In the trailing partial line, stop after the last sentence whose link/code markers are closed
+        line = text[line_end:limit]
+        if line.lstrip().startswith("|"):
+            return line_end  # Table rows are cleaned as a whole
+        safe = line_end
+        for match in SENTENCE_BREAK.finditer(line):
+            head = line[:match.end()]
+            if head.count("[") == head.count("]") and head.count("`") % 2 == 0 and head.count("**") % 2 == 0:
+                safe = line_end + match.end()
+        return safe
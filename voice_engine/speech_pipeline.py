@@ -0,0 +1,124 @@
+"""Sentence-pipelined text-to-speech for streamed responses"""
+import asyncio
+import re
+
+from . import telemetry
+from .lazy import lazy_import
+from .tts_cache import get_tts_cache
+from .workers import get_workers
+
+edge_tts = lazy_import("edge_tts")
+
+log = telemetry.get_logger("tts")
+
+# A sentence ends at . ! ? followed by whitespace, right after 。！？ (CJK has no spaces), or at a line break
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])\s*|\n+')
+
+# Fragments shorter than this ("1.", "Wow!") are merged into the next sentence
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text):
+    """Split text into complete sentences and the unfinished remainder"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentence = text[start:match.start()]
+        if len(sentence.strip()) < MIN_SENTENCE_CHARS:
+            continue  # Keep accumulating until the fragment is long enough
+        sentences.append(sentence)
+        start = match.end()
+    return sentences, text[start:]
+
+
+async def synthesize_speech(text, voice, rate='+0%', pitch='+0Hz', volume='+0%'):
+    """Synthesize text with Edge TTS and return the MP3 bytes, served from the TTS cache when possible"""
+    cache = get_tts_cache()
+    if cache:
+        # The cache reads and writes files, which would stall every other synthesis on this loop
+        audio = await asyncio.to_thread(cache.get, text, voice, rate, pitch, volume)
+        if audio:
+            log.debug("Cache hit (%d bytes) - %s", len(audio), cache.stats())
+            telemetry.annotate(tts_cache_hit=True)
+            return audio
+
+    with telemetry.span("tts_synthesis"):
+        communicate = edge_tts.Communicate(text, voice, rate=rate, pitch=pitch, volume=volume)
+        audio = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        audio = bytes(audio)
+
+    if cache:
+        await asyncio.to_thread(cache.put, text, voice, audio, rate, pitch, volume)
+    return audio
+
+
+class SpeechPipeline:
+    """Synthesize sentences concurrently while the response streams in, yield audio in order
+
+    prepare(sentence) returns the [(clean_text, voice)] segments to speak for a raw sentence,
+    empty to skip it.
+    """
+
+    def __init__(self, prepare, max_concurrency=3):
+        self._prepare = prepare
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        self._buffer = ""
+        self._futures = []  # One future per segment, in speaking order
+        self._next_index = 0
+        self._closed = False
+
+        # Edge TTS is async - it runs on the shared worker loop so the Streamlit thread never blocks on it
+        self._workers = get_workers()
+
+    def feed(self, text):
+        """Add streamed text and start synthesizing every sentence it completes"""
+        self._buffer += text
+        sentences, self._buffer = split_sentences(self._buffer)
+        for sentence in sentences:
+            self._submit(sentence)
+
+    def close(self):
+        """Flush the trailing partial sentence once the stream has finished"""
+        if self._buffer.strip():
+            self._submit(self._buffer)
+        self._buffer = ""
+        self._closed = True
+
+    def finished(self):
+        """True once closed and the audio of every sentence has been taken"""
+        return self._closed and self._next_index >= len(self._futures)
+
+    def ready_segments(self):
+        """Yield audio for the next sentences that are already synthesized, without blocking"""
+        while self._next_index < len(self._futures) and self._futures[self._next_index].done():
+            audio = self._take(self._next_index)
+            if audio:
+                yield audio
+
+    def shutdown(self):
+        """Cancel synthesis of sentences that were never taken, e.g. when the reply failed"""
+        for future in self._futures[self._next_index:]:
+            future.cancel()
+
+    def _submit(self, sentence):
+        for text, voice in self._prepare(sentence):
+            self._futures.append(self._workers.run_coroutine(self._synthesize(text, voice)))
+
+    async def _synthesize(self, text, voice):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            return await synthesize_speech(text, voice)
+
+    def _take(self, index):
+        self._next_index = index + 1
+        try:
+            return self._futures[index].result()
+        except Exception as e:
+            # Skip the sentence rather than dropping the whole reply
+            log.warning("TTS segment %d error: %s: %s", index, type(e).__name__, e)
+            return None
@@ -0,0 +1,99 @@
+"""Replies followed a poll at a time, so the Streamlit script never waits on Gemini or Edge TTS"""
+from . import telemetry
+from .script_detect import speech_segments
+from .speech_cleaner import StreamingCleaner, clean_for_speech
+from .speech_pipeline import SpeechPipeline
+
+log = telemetry.get_logger("reply")
+
+
+class SpokenReply:
+    """A reply job and the speech for it, advanced by poll() without blocking
+
+    The app keeps one in session_state and polls it from a fragment: each poll takes the
+    chunks the worker published since the last one and the sentence audio that has finished.
+    With pipelined speech each sentence is synthesized as soon as it is complete, otherwise
+    the whole reply is spoken once it has arrived. voice=None skips speech.
+
+    Pass text (and audio) instead of a job when the reply is already known, e.g. a response
+    cache hit; only the speech missing for it is then waited for.
+    """
+
+    def __init__(self, job=None, voice=None, pipelined=True, text=None, audio=None):
+        self.job = job
+        self.text = ""  # Reply so far
+        self.audio = list(audio or [])  # MP3 of each spoken segment, in order
+        self.error = None  # What the reply job raised
+        self.text_done = False
+        self.done = False  # Text complete and every segment's audio taken
+        self._known_text = text
+        self._taken = 0  # Job updates consumed so far
+        self._pipelined = pipelined
+        self._cleaner = StreamingCleaner()
+        self._pipeline = SpeechPipeline(lambda sentence: speech_segments(sentence, voice)) if voice else None
+
+    def poll(self):
+        """Take whatever text and audio is ready, returning True while more is to come"""
+        if self.done:
+            return False
+
+        if not self.text_done:
+            if self.job is None:
+                self._finish_text(self._known_text or "")
+            else:
+                finished = self.job.done()  # Checked first so nothing published before finishing is missed
+                chunks = self.job.published(self._taken)
+                self._taken += len(chunks)
+                for chunk in chunks:
+                    self._add_text(chunk)
+                if finished:
+                    try:
+                        self._finish_text(self.job.result() or self.text)
+                    except Exception as e:
+                        log.error("Reply error: %s: %s", type(e).__name__, e)
+                        self.error = e
+                        self.cancel()
+                        return False
+
+        if self._pipeline is not None:
+            self.audio.extend(self._pipeline.ready_segments())
+            self.done = self.text_done and self._pipeline.finished()
+        else:
+            self.done = self.text_done
+        return not self.done
+
+    def cancel(self):
+        """Stop the reply job and drop speech that hasn't been taken"""
+        if self.job is not None:
+            self.job.cancel()
+        if self._pipeline is not None:
+            self._pipeline.shutdown()
+        self.done = True
+
+    def _add_text(self, chunk):
+        telemetry.mark("first_text")
+        self.text += chunk
+        if self._pipeline is not None and self._pipelined:
+            # Markdown is cleaned as it streams, so code blocks and tables never reach the voice
+            with telemetry.span("markdown_cleaning"):
+                cleaned = self._cleaner.feed(chunk)
+            self._pipeline.feed(cleaned)
+
+    def _finish_text(self, full_text):
+        # A streamed reply ends with the text already taken, a non-streamed one arrives whole
+        if full_text.startswith(self.text) and full_text != self.text:
+            self._add_text(full_text[len(self.text):])
+        self.text = full_text
+        self.text_done = True
+
+        if self._pipeline is None:
+            return
+        if self._pipelined:
+            with telemetry.span("markdown_cleaning"):
+                self._pipeline.feed(self._cleaner.close())
+        else:
+            with telemetry.span("markdown_cleaning"):
+                clean_text = clean_for_speech(full_text)
+            log.debug("Response %d chars, %d after cleaning for speech", len(full_text), len(clean_text))
+            self._pipeline.feed(clean_text)
+        self._pipeline.close()
@@ -0,0 +1,74 @@
+"""Speech-to-text service: recorded WAV bytes in, transcript and status out"""
+from . import stt_backends, telemetry
+from .lazy import lazy_import
+
+log = telemetry.get_logger("stt")
+
+# SpeechRecognition and numpy (via the VAD and resampler) load with the first recording
+sr = lazy_import("speech_recognition")
+vad = lazy_import(f"{__package__}.vad")
+resampler = lazy_import(f"{__package__}.resample")
+
+
+def transcribe_audio(audio_bytes, language='en-US', on_partial=None):
+    """Convert audio bytes to text using speech recognition"""
+    if not audio_bytes or len(audio_bytes) == 0:
+        return None, "empty", None  # Return error type and text
+
+    try:
+        # The audio_recorder returns WAV audio data, decoded and downmixed to mono in memory
+        with telemetry.span("wav_decode"):
+            samples, sample_rate = vad.read_wav(audio_bytes)
+
+        # Recognizers only need 16 kHz - resampling first shrinks the upload and the VAD work
+        with telemetry.span("resample"):
+            samples = resampler.resample(samples, sample_rate, resampler.STT_SAMPLE_RATE)
+        sample_rate = resampler.STT_SAMPLE_RATE
+
+        # Trim leading and trailing silence, clips without speech never reach the recognizer
+        with telemetry.span("vad"):
+            speech = vad.trim_silence(samples, sample_rate)
+        if speech is None:
+            return None, "silent", None
+        log.debug("Speech %.2fs of %.2fs recorded", len(speech) / sample_rate, len(samples) / sample_rate)
+        telemetry.annotate(speech_seconds=round(len(speech) / sample_rate, 2))
+        audio_data = sr.AudioData(speech.astype("<i2").tobytes(), sample_rate, 2)
+
+        recognizer = sr.Recognizer()
+
+        # Transcribe with selected language on the configured backend (STT_BACKEND)
+        with telemetry.span("recognition"):
+            text = stt_backends.recognize(recognizer, audio_data, language, on_partial=on_partial)
+
+        if not text or text.strip() == "":
+            return None, "silent", None
+
+        return text, "success", None
+
+    except sr.UnknownValueError:
+        return None, "no_speech", None
+    except stt_backends.UnsupportedLanguageError as e:
+        log.warning("Recognition language not supported: %s", e)
+        return None, "unsupported_language", None
+    except stt_backends.BackendSetupError as e:
+        log.warning("Speech recognition backend not set up: %s", e)
+        return None, "backend_unavailable", None
+    except sr.RequestError as e:
+        log.warning("Recognition request failed: %s", e)
+        return None, "network_error", None
+    except Exception as e:
+        log.warning("Transcription error: %s: %s", type(e).__name__, e)
+        return None, "unknown_error", None
+
+
+def transcribe_job(job, audio_bytes, language, speculation=None):
+    """Worker: transcribe_audio for the shared pool, opening the speculative reply as soon as text is known"""
+    on_partial = speculation.offer_partial if speculation else None
+    result = transcribe_audio(audio_bytes, language, on_partial=on_partial)
+    if speculation:
+        transcribed_text, status, _ = result
+        if status == "success":
+            speculation.offer(transcribed_text)
+        else:
+            speculation.cancel()
+    return result
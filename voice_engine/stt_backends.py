@@ -0,0 +1,190 @@
+"""Speech-recognition backends used by transcribe_audio"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from .lazy import lazy_import
+
+sr = lazy_import("speech_recognition")
+
+# Which engine transcribes voice input: google (online), sphinx or vosk (offline, CPU-only)
+STT_BACKEND = os.getenv("STT_BACKEND", "google").lower()
+
+# Vosk needs a downloaded model directory, see https://alphacephei.com/vosk/models
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "model")
+
+
+class UnsupportedLanguageError(Exception):
+    """The backend has no model for the requested language"""
+
+
+class BackendSetupError(Exception):
+    """An offline backend's engine or model isn't installed on this machine"""
+
+
+class RecognizerBackend:
+    """Turn sr.AudioData into text
+
+    Raise sr.UnknownValueError when nothing was understood and sr.RequestError when the
+    engine can't be reached, same as the speech_recognition recognizers, BackendSetupError
+    when a local engine or its model isn't installed, and UnsupportedLanguageError when it
+    can't recognize the language at all.
+    Backends with interim results call on_partial(text) while decoding, the others ignore it.
+    """
+
+    name = None
+    offline = False
+    partial_results = False
+
+    def recognize(self, recognizer, audio_data, language, on_partial=None):
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API - needs a network round trip per turn"""
+
+    name = "google"
+
+    def recognize(self, recognizer, audio_data, language, on_partial=None):
+        return recognizer.recognize_google(audio_data, language=language)
+
+
+class SphinxBackend(RecognizerBackend):
+    """CMU PocketSphinx - local, ships with an en-US model"""
+
+    name = "sphinx"
+    offline = True
+
+    def recognize(self, recognizer, audio_data, language, on_partial=None):
+        # recognize_sphinx reports a missing module or language as a RequestError, like an engine that's down
+        try:
+            import pocketsphinx  # noqa: F401
+        except ImportError:
+            raise BackendSetupError("pocketsphinx is not installed (pip install pocketsphinx)")
+        data_directory = os.path.join(os.path.dirname(sr.__file__), "pocketsphinx-data", language)
+        if not os.path.isdir(data_directory):
+            raise UnsupportedLanguageError(f"no PocketSphinx model for {language} in {data_directory}")
+        return recognizer.recognize_sphinx(audio_data, language=language)
+
+
+class VoskBackend(RecognizerBackend):
+    """Vosk (Kaldi) - local, language is fixed by the model in VOSK_MODEL_PATH"""
+
+    name = "vosk"
+    offline = True
+    partial_results = True
+    sample_rate = 16000
+    partial_step = 16000  # Bytes fed between interim results - half a second of 16-bit mono
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load_model(self):
+        # Loading a model takes seconds, do it once per process
+        with self._lock:
+            if self._model is None:
+                try:
+                    import vosk
+                except ImportError:
+                    raise BackendSetupError("vosk is not installed (pip install vosk)")
+                if not os.path.isdir(self.model_path):
+                    raise BackendSetupError(f"Vosk model not found at {self.model_path}, set VOSK_MODEL_PATH")
+                vosk.SetLogLevel(-1)
+                self._model = vosk.Model(self.model_path)
+        return self._model
+
+    def recognize(self, recognizer, audio_data, language, on_partial=None):
+        model = self._load_model()
+        import vosk
+
+        kaldi = vosk.KaldiRecognizer(model, self.sample_rate)
+        raw = audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2)
+        if on_partial is None:
+            kaldi.AcceptWaveform(raw)
+            finished = []
+        else:
+            finished = self._decode_with_partials(kaldi, raw, on_partial)
+        finished.append(json.loads(kaldi.FinalResult()).get("text", ""))
+        text = " ".join(part for part in finished if part)
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def _decode_with_partials(self, kaldi, raw, on_partial):
+        # Utterances Vosk has closed at a pause, the open one is reported as interim text
+        finished = []
+        for start in range(0, len(raw), self.partial_step):
+            if kaldi.AcceptWaveform(raw[start:start + self.partial_step]):
+                finished.append(json.loads(kaldi.Result()).get("text", ""))
+                partial = ""
+            else:
+                partial = json.loads(kaldi.PartialResult()).get("partial", "")
+            on_partial(" ".join(part for part in finished + [partial] if part))
+        return finished
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    SphinxBackend.name: SphinxBackend,
+    VoskBackend.name: VoskBackend,
+}
+
+
+class LatencyStats:
+    """Rolling recognition latency per backend"""
+
+    def __init__(self, window=100):
+        self._samples = {}
+        self._counts = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, backend_name, seconds):
+        with self._lock:
+            self._samples.setdefault(backend_name, deque(maxlen=self._window)).append(seconds)
+            self._counts[backend_name] = self._counts.get(backend_name, 0) + 1
+
+    def report(self):
+        """{backend: {count, last, mean, p95}} in seconds over the recent window"""
+        with self._lock:
+            report = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                report[name] = {
+                    "count": self._counts[name],
+                    "last": samples[-1],
+                    "mean": sum(ordered) / len(ordered),
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                }
+            return report
+
+
+latency_stats = LatencyStats()
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """Shared backend instance by name, defaults to STT_BACKEND"""
+    name = (name or STT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown STT backend '{name}', choose from: {', '.join(BACKENDS)}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def recognize(recognizer, audio_data, language, backend=None, on_partial=None):
+    """Transcribe with the selected backend and record how long it took"""
+    backend = backend or get_backend()
+    start = time.perf_counter()
+    try:
+        return backend.recognize(recognizer, audio_data, language, on_partial=on_partial)
+    finally:
+        latency_stats.record(backend.name, time.perf_counter() - start)
@@ -0,0 +1,208 @@
+"""Leveled logging and per-turn latency spans, exported as JSON lines and optional Prometheus histograms
+
+A turn is one prompt from recording (or typing) to rendered reply. Code on the way records
+spans against the current turn, which follows the work onto worker threads and the TTS loop
+through a context variable:
+
+    turn = telemetry.start_turn("voice", audio_bytes=len(audio_bytes))
+    with telemetry.span("recognition"):
+        ...
+    telemetry.finish_turn()
+
+Spans and marks outside a turn are ignored, so the engine can be used without telemetry.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Engine log level: DEBUG shows the pipeline's diagnostic lines, which are off by default
+LOG_LEVEL = os.getenv("VOICE_LOG_LEVEL", "WARNING").upper()
+
+# Where finished turns are written, one JSON object per line: a file path, "stderr", or empty to disable
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG", "")
+
+# Port of a Prometheus /metrics endpoint with span histograms, needs prometheus_client (0 disables)
+PROMETHEUS_PORT = int(os.getenv("PROMETHEUS_PORT", "0"))
+
+# Histogram buckets in seconds, from a cache hit to a slow reply
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current_turn = contextvars.ContextVar("voice_turn", default=None)
+_setup_lock = threading.Lock()
+_turn_log = None
+_histogram = None
+_exporters_ready = False
+
+
+def get_logger(name):
+    """Logger under voice_engine, printed to stderr at VOICE_LOG_LEVEL"""
+    root = logging.getLogger("voice_engine")
+    with _setup_lock:
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("[%(name)s %(levelname)s] %(message)s"))
+            root.addHandler(handler)
+            root.setLevel(LOG_LEVEL)
+            root.propagate = False
+    return logging.getLogger(f"voice_engine.{name}")
+
+
+log = get_logger("telemetry")
+
+
+class Turn:
+    """Timeline of one turn: spans and marks in ms from its start, plus descriptive fields"""
+
+    def __init__(self, kind, **fields):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.fields = fields
+        self.spans = {}  # name -> {"start_ms", "ms", "count"}, repeated spans (per sentence) add up
+        self.marks = {}  # name -> ms since the start, first occurrence only
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add_span(self, name, started, ended):
+        start_ms = (started - self.started) * 1000
+        with self._lock:
+            entry = self.spans.setdefault(name, {"start_ms": round(start_ms, 1), "ms": 0.0, "count": 0})
+            entry["ms"] += (ended - started) * 1000
+            entry["count"] += 1
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.setdefault(name, round((time.perf_counter() - self.started) * 1000, 1))
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def record(self, status):
+        with self._lock:
+            return {
+                "turn": self.id,
+                "kind": self.kind,
+                "status": status,
+                "timestamp": round(self.timestamp, 3),
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "spans": {name: {**entry, "ms": round(entry["ms"], 1)} for name, entry in self.spans.items()},
+                "marks": dict(self.marks),
+                **self.fields,
+            }
+
+
+def start_turn(kind, **fields):
+    """Begin a turn and make it current for this thread or task and the work it submits"""
+    turn = Turn(kind, **fields)
+    _current_turn.set(turn)
+    return turn
+
+
+def activate(turn):
+    """Make an existing turn current again, e.g. on the Streamlit rerun that continues it"""
+    _current_turn.set(turn)
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+@contextmanager
+def span(name):
+    """Time the block as a span of the current turn"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.add_span(name, started, time.perf_counter())
+
+
+def record_span(name, started):
+    """Span of the current turn from a perf_counter() taken earlier until now"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add_span(name, started, time.perf_counter())
+
+
+def mark(name):
+    """Note when something first happened in the current turn"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.mark(name)
+
+
+def annotate(**fields):
+    """Attach fields (cache hit, backend, sizes) to the current turn's record"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.set(**fields)
+
+
+def finish_turn(status="ok", turn=None):
+    """Export the current (or given) turn once and stop recording into it"""
+    turn = turn or _current_turn.get()
+    if turn is None or turn.finished:
+        return None
+    turn.finished = True
+    if _current_turn.get() is turn:
+        _current_turn.set(None)
+
+    record = turn.record(status)
+    _export(record)
+    return record
+
+
+def _setup_exporters():
+    global _turn_log, _histogram, _exporters_ready
+    with _setup_lock:
+        if _exporters_ready:
+            return
+        _exporters_ready = True
+
+        if TELEMETRY_LOG:
+            _turn_log = logging.getLogger("voice_engine.turns")
+            if TELEMETRY_LOG == "stderr":
+                handler = logging.StreamHandler(sys.stderr)
+            else:
+                handler = logging.FileHandler(TELEMETRY_LOG, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _turn_log.addHandler(handler)
+            _turn_log.setLevel(logging.INFO)
+            _turn_log.propagate = False
+
+        if PROMETHEUS_PORT:
+            try:
+                from prometheus_client import Histogram, start_http_server
+            except ImportError:
+                log.warning("PROMETHEUS_PORT is set but prometheus_client is not installed, skipping metrics")
+                return
+            _histogram = Histogram(
+                "voice_turn_span_seconds", "Time spent in each stage of a voice assistant turn",
+                ["kind", "span"], buckets=LATENCY_BUCKETS,
+            )
+            start_http_server(PROMETHEUS_PORT)
+            log.info("Prometheus metrics on port %d", PROMETHEUS_PORT)
+
+
+def _export(record):
+    _setup_exporters()
+    if _turn_log is not None:
+        _turn_log.info(json.dumps(record, ensure_ascii=False))
+    if _histogram is not None:
+        kind = record["kind"]
+        _histogram.labels(kind, "turn").observe(record["total_ms"] / 1000)
+        for name, entry in record["spans"].items():
+            _histogram.labels(kind, name).observe(entry["ms"] / 1000)
+        for name, offset_ms in record["marks"].items():
+            _histogram.labels(kind, name).observe(offset_ms / 1000)
+    log.debug("Turn %s %s in %.0f ms", record["turn"], record["status"], record["total_ms"])
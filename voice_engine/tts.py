@@ -0,0 +1,70 @@
+"""Text-to-speech service: Edge TTS with a native voice for each language in mixed text"""
+import tempfile
+
+from . import telemetry
+from .script_detect import script_proportions, speech_segments
+from .speech_pipeline import synthesize_speech
+from .workers import get_workers
+
+log = telemetry.get_logger("tts")
+
+# Voice used when none is selected
+DEFAULT_VOICE = 'en-US-GuyNeural'
+
+
+def text_to_speech_bytes(text, voice=None):
+    """Convert text to speech with Edge TTS and return the MP3 bytes without touching disk"""
+    try:
+        # Use provided voice or default to English male
+        if not voice:
+            voice = DEFAULT_VOICE
+
+        # Generate speech with Edge TTS (natural pauses at periods, commas, etc.)
+        # Using expressive style for more emotions and dramatic pauses
+
+        log.debug("Text length: %d chars, voice: %s", len(text), voice)
+        log.debug("First 150 chars: %s", text[:150])
+        log.debug("Last 150 chars: %s", text[-150:])
+
+        async def generate_speech():
+            # Split mixed-language text by script and read each part with a voice that speaks it
+            segments = speech_segments(text, voice)
+            if len(segments) > 1:
+                proportions = {script: round(share, 2) for script, share in script_proportions(text, voice).items()}
+                log.debug("Mixed-language text %s, voices: %s", proportions, [v for _, v in segments])
+
+            # Stream chunks straight into a buffer, cached utterances skip the Edge TTS round trip
+            audio = []
+            for segment, segment_voice in segments:
+                audio.append(await synthesize_speech(segment, segment_voice, rate='+0%', pitch='+0Hz', volume='+0%'))
+
+            # MP3 frames concatenate into one playable file
+            return b"".join(audio)
+
+        # Run on the shared TTS loop instead of starting a new event loop per reply
+        audio = get_workers().run_coroutine(generate_speech()).result()
+
+        if audio:
+            log.debug("Audio size: %d bytes", len(audio))
+        else:
+            log.warning("No audio generated")
+
+        return audio
+    except Exception as e:
+        # Log the specific error, the caller decides what to tell the user
+        log.error("TTS error: %s: %s", type(e).__name__, e)
+        return None
+
+
+def text_to_speech(text, voice=None):
+    """Convert text to speech using Edge TTS and return the path of a temp MP3 file"""
+    audio = text_to_speech_bytes(text, voice)
+    if not audio:
+        return None
+
+    # Caller owns the file and deletes it when done
+    with telemetry.span("temp_file_write"):
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
+            temp_file.write(audio)
+    log.debug("Audio file created: %s", temp_file.name)
+    return temp_file.name
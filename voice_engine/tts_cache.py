@@ -0,0 +1,151 @@
+"""Disk-backed, size-bounded cache for synthesized speech"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .telemetry import get_logger
+
+log = get_logger("tts_cache")
+
+# Where cached MP3s live and how much disk they may use (set TTS_CACHE_MAX_MB=0 to disable)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "voiceai_tts_cache"))
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "100")) * 1024 * 1024)
+
+
+class TTSCache:
+    """MP3 files keyed by (cleaned text, voice, rate, pitch, volume), evicted least recently used first"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(text, voice, rate='+0%', pitch='+0Hz', volume='+0%'):
+        """Content address of an utterance"""
+        return hashlib.sha256("\0".join((text, voice, rate, pitch, volume)).encode("utf-8")).hexdigest()
+
+    def get(self, text, voice, rate='+0%', pitch='+0Hz', volume='+0%'):
+        """Return cached MP3 bytes, or None on a miss"""
+        key = self.make_key(text, voice, rate, pitch, volume)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            # Touch the file so recency survives a restart
+            os.utime(path)
+        except OSError:
+            # Deleted behind our back - forget it
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def put(self, text, voice, audio, rate='+0%', pitch='+0Hz', volume='+0%'):
+        """Store MP3 bytes and evict old entries until the cache fits"""
+        if not audio or len(audio) > self.max_bytes:
+            return
+
+        key = self.make_key(text, voice, rate, pitch, volume)
+        path = self._path(key)
+
+        # Write to a temp name first so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("TTS cache write error: %s", e)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(audio)
+            self._total_bytes += len(audio)
+            self._evict()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        # Rebuild LRU order from file modification times left by a previous process
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            elif name.endswith(".mp3"):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Process-wide cache shared by every session, or None when disabled"""
+    global _cache
+    if TTS_CACHE_MAX_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+        return _cache
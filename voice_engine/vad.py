@@ -0,0 +1,92 @@
+"""Energy-based voice activity detection: trim silence from recordings before recognition"""
+import io
+import os
+import wave
+
+import numpy as np
+
+# Frame length the energy is measured over
+VAD_FRAME_MS = 30
+
+# A frame is speech when it is this much louder than the recording's noise floor...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# ...and louder than this absolute level, so a silent clip's own hiss isn't speech (dBFS)
+VAD_FLOOR_DB = float(os.getenv("VAD_FLOOR_DB", "-50"))
+# Frames this loud are always speech, even in a clip with no pause to measure the noise floor from
+VAD_CEILING_DB = -30.0
+
+# Clips with less speech than this are rejected as empty
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))
+
+# Audio kept either side of the detected speech so soft word edges aren't clipped
+VAD_PADDING_MS = 200
+
+
+def read_wav(wav_bytes):
+    """Decode WAV bytes to (int16 mono samples, sample rate), channels are averaged"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2")
+    elif width == 3:
+        # 24-bit has no numpy dtype - keep the top two bytes of each little-endian sample
+        samples = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2").ravel()
+    elif width == 4:
+        samples = (np.frombuffer(frames, dtype="<i4") >> 16).astype(np.int16)
+    else:
+        raise wave.Error(f"unsupported sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+        samples = samples.mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def frame_energy_db(samples, sample_rate, frame_ms=VAD_FRAME_MS):
+    """RMS level of each frame in dBFS, computed for every frame at once"""
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+    count = len(samples) // frame_length
+    if count == 0:
+        return np.empty(0)
+    frames = samples[:count * frame_length].reshape(count, frame_length).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) / 32768.0
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def detect_speech(samples, sample_rate, frame_ms=VAD_FRAME_MS, margin_db=VAD_MARGIN_DB, floor_db=VAD_FLOOR_DB,
+                  ceiling_db=VAD_CEILING_DB, min_speech_ms=VAD_MIN_SPEECH_MS, padding_ms=VAD_PADDING_MS):
+    """(start, end) sample range from the first to the last speech frame plus padding, or None
+
+    The noise floor is the 10th percentile frame level, so it adapts to the room without
+    spending part of the clip on calibration the way adjust_for_ambient_noise does.
+    """
+    energy = frame_energy_db(samples, sample_rate, frame_ms)
+    if len(energy) == 0:
+        return None
+
+    noise_floor = np.percentile(energy, 10)
+    speech = energy > max(min(noise_floor + margin_db, ceiling_db), floor_db)
+    if np.count_nonzero(speech) * frame_ms < min_speech_ms:
+        return None
+
+    speech_frames = np.flatnonzero(speech)
+    frame_length = int(sample_rate * frame_ms / 1000)
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(int(speech_frames[0]) * frame_length - padding, 0)
+    end = min((int(speech_frames[-1]) + 1) * frame_length + padding, len(samples))
+    return start, end
+
+
+def trim_silence(samples, sample_rate, **options):
+    """Samples with leading and trailing silence removed, or None when there is no speech"""
+    speech = detect_speech(samples, sample_rate, **options)
+    if speech is None:
+        return None
+    start, end = speech
+    return samples[start:end]
@@ -0,0 +1,129 @@
+"""Shared background workers: one asyncio loop for Edge TTS and a bounded thread pool for STT and Gemini"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Speech recognition and Gemini calls running at once across every session, extra jobs queue
+WORKER_THREADS = max(int(os.getenv("WORKER_THREADS", "8")), 1)
+
+
+class Job:
+    """Handle for work on the shared pool, kept in session_state and polled by the UI
+
+    The worker function receives the job first so it can publish partial results and
+    stop early once the job is cancelled.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.future = None
+        self.started = time.monotonic()
+        self._cancelled = threading.Event()
+        self._updates = []  # Partial results published by the worker, in order
+        self._lock = threading.Lock()
+        self._listeners = []  # Called from the worker thread on every update and when the job finishes
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout=None):
+        """Wait for the job and return what the worker returned, raising what it raised"""
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """Drop the job if it hasn't started, otherwise ask the worker to stop at its next check"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def publish(self, update):
+        """Called by the worker with each partial result"""
+        with self._lock:
+            self._updates.append(update)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def published(self, start=0):
+        """Partial results published so far from index start, without waiting"""
+        with self._lock:
+            return self._updates[start:]
+
+    async def async_updates(self):
+        """Yield partial results as they are published, until the job finishes, without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(changed.set)
+
+        with self._lock:
+            self._listeners.append(wake)
+        try:
+            index = 0
+            while True:
+                changed.clear()  # Cleared before looking, so a wake-up after this is never lost
+                finished = self.done()
+                with self._lock:
+                    pending = self._updates[index:]
+                index += len(pending)
+                for update in pending:
+                    yield update
+                if finished and not pending:
+                    return
+                if not pending:
+                    await changed.wait()
+        finally:
+            with self._lock:
+                self._listeners.remove(wake)
+
+    def _finished(self, _future):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+
+class Workers:
+    """Bounded thread pool plus one long-lived event loop, shared by every session in the process"""
+
+    def __init__(self, max_threads=WORKER_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="voice-worker")
+
+        # Edge TTS is async - one loop serves every reply instead of a new loop per asyncio.run
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name="voice-tts-loop", daemon=True)
+        self._loop_thread.start()
+
+    def submit(self, kind, function, *args):
+        """Run function(job, *args) on the pool and return its Job"""
+        job = Job(kind)
+        # The worker sees the submitter's context variables, e.g. the telemetry turn it belongs to
+        context = contextvars.copy_context()
+        job.future = self._pool.submit(context.run, function, job, *args)
+        job.future.add_done_callback(job._finished)
+        return job
+
+    def run_coroutine(self, coroutine):
+        """Schedule a coroutine on the shared loop, returning a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def get_workers():
+    """Process-wide workers shared by every session"""
+    global _workers
+    with _workers_lock:
+        if _workers is None:
+            _workers = Workers()
+        return _workers